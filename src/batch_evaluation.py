@@ -0,0 +1,111 @@
+"""Batch evaluation
+
+Packed configurations (see PlantState) are evaluated with check_configuration_v2 in a pool of worker processes. Each worker builds its plant once and keeps its visibility graph cache between configurations (see worker_pool.WorkerState), and the configurations are sent in chunks, so the process communication is paid once per chunk instead of once per configuration.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from graph.problem import ReachTables
+from graph.process import ManufacturingProcessGraph
+from model.plant_state import PlantState
+from model.tools import SystemSpecification
+from worker_pool import WorkerState, create_pool, worker_state
+
+DEFAULT_CHUNK_SIZE = 64
+
+
+class BatchEvaluator:
+    """Evaluator of packed configurations, in a pool of warm worker processes or in the current process with one worker
+
+    Results are the same as check_configuration_v2: the cost of a valid configuration or False. The pool is kept until close is called, so it can be reused for several batches.
+    """
+
+    def __init__(
+        self,
+        spec: SystemSpecification,
+        workers: int = 1,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        use_reach_tables: bool = True,
+    ) -> None:
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+        flow_graph = ManufacturingProcessGraph(spec.model)
+        flow_graph.generate_model_graph()
+        reach_tables = ReachTables(flow_graph, spec) if use_reach_tables else None
+
+        self._executor: ProcessPoolExecutor | None = None
+        # With one worker, the state is kept by the evaluator, so several evaluators can be used in the same process
+        self._worker_state: WorkerState | None = None
+
+        if workers > 1:
+            self._executor = create_pool(workers, spec, flow_graph, reach_tables)
+        else:
+            self._worker_state = WorkerState(spec, flow_graph, reach_tables)
+
+    def evaluate_many(self, layouts: Iterable[PlantState]) -> Iterator[float | bool]:
+        """Evaluate the configurations in chunks, the results are yielded in the same order
+
+        Only a few chunks per worker are sent ahead, so layouts can be a long or endless generator.
+        """
+        layouts = iter(layouts)
+        chunks = iter(lambda: list(islice(layouts, self.chunk_size)), [])
+
+        if self._executor is None:
+            assert self._worker_state is not None
+            for chunk in chunks:
+                yield from self._worker_state.evaluate(chunk)
+            return
+
+        pending: deque[Future[list[float | bool]]] = deque()
+
+        for chunk in chunks:
+            pending.append(self._executor.submit(_evaluate_chunk, chunk))
+            if len(pending) >= 2 * self.workers:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+    def evaluate_array(self, layouts: Iterable[PlantState]) -> np.ndarray:
+        """Evaluate the configurations, invalid configurations are NaN"""
+        return np.fromiter(
+            (
+                np.nan if result is False else result
+                for result in self.evaluate_many(layouts)
+            ),
+            dtype=float,
+        )
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> BatchEvaluator:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def evaluate_many(
+    layouts: Iterable[PlantState],
+    spec: SystemSpecification,
+    workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[float | bool]:
+    """Evaluate the configurations in a pool created for this batch, see BatchEvaluator"""
+    with BatchEvaluator(spec, workers, chunk_size) as evaluator:
+        yield from evaluator.evaluate_many(layouts)
+
+
+def _evaluate_chunk(chunk: list[PlantState]) -> list[float | bool]:
+    return worker_state().evaluate(chunk)
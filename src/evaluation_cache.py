@@ -0,0 +1,168 @@
+"""Evaluation cache
+
+Results of check_configuration_v2 stored in a SQLite database, so they can be reused between runs of the same model. Entries are keyed by the hash of the model (see SystemSpecification.content_hash) and the packed configuration key, with the interchangeable stations in canonical order if a symmetry is used, so changing anything in the model starts a new set of entries. Mirrored configurations are never stored in the same entry, as they can get different results (see model.symmetry). The least recently used entries are evicted when the cache grows over its maximum size.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+from model.plant_state import PlantState
+from model.symmetry import PlantSymmetry
+from model.tools import SystemSpecification
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+# Changes kept in memory before they are written in a single transaction
+COMMIT_INTERVAL = 256
+
+# Changed whenever the configuration keys change, so the entries stored with other keys are not used
+KEY_VERSION = 2
+
+
+class EvaluationCache:
+    """On disk cache of configuration results
+
+    Accesses are counted in hits and misses. New results and the last use of the entries read are kept in memory, and they are written in a single transaction every COMMIT_INTERVAL changes and when flush is called. Reads don't lock the database, so several processes can share the same database file and each one only locks it for short writes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        spec: SystemSpecification,
+        symmetry: PlantSymmetry | None = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._spec_hash = f"{KEY_VERSION}-{spec.content_hash()}"
+        self._interchangeable = (
+            symmetry.interchangeable if symmetry is not None else None
+        )
+
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS evaluations (
+                spec_hash TEXT NOT NULL,
+                layout BLOB NOT NULL,
+                feasible INTEGER NOT NULL,
+                cost REAL NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (spec_hash, layout)
+            )""")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS evaluations_last_used ON evaluations (last_used)"
+        )
+        self._connection.commit()
+
+        # Logical clock of the accesses, used to find the least recently used entries
+        (last_used,) = self._connection.execute(
+            "SELECT COALESCE(MAX(last_used), 0) FROM evaluations"
+        ).fetchone()
+        self._clock: int = last_used
+
+        # Changes not written yet, by configuration key
+        self._pending_results: dict[bytes, tuple[int, float, int]] = {}
+        self._pending_uses: dict[bytes, int] = {}
+
+    def _key(self, state: PlantState) -> bytes:
+        if self._interchangeable is not None:
+            return self._interchangeable.canonical_key(state.cells)
+        return state.cells
+
+    def get(self, state: PlantState) -> float | bool | None:
+        """Get the cached result of a configuration, as returned by check_configuration_v2, or None if it is not cached"""
+        key = self._key(state)
+
+        pending = self._pending_results.get(key)
+        if pending is not None:
+            self.hits += 1
+            self._clock += 1
+            feasible, cost, _ = pending
+            self._pending_results[key] = (feasible, cost, self._clock)
+            return cost if feasible else False
+
+        row = self._connection.execute(
+            "SELECT feasible, cost FROM evaluations WHERE spec_hash = ? AND layout = ?",
+            (self._spec_hash, key),
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._clock += 1
+        self._pending_uses[key] = self._clock
+        self._write_if_due()
+
+        feasible, cost = row
+        return cost if feasible else False
+
+    def put(self, state: PlantState, result: float | bool) -> None:
+        """Store the result of a configuration, as returned by check_configuration_v2"""
+        key = self._key(state)
+
+        self._clock += 1
+        self._pending_results[key] = (1 if result else 0, float(result), self._clock)
+        self._pending_uses.pop(key, None)
+        self._write_if_due()
+
+    def _write_if_due(self) -> None:
+        if len(self._pending_results) + len(self._pending_uses) >= COMMIT_INTERVAL:
+            self.flush()
+
+    def evict(self) -> int:
+        """Remove the least recently used entries over max_entries
+
+        Returns:
+            int: number of entries removed
+        """
+        self.flush()
+
+        (count,) = self._connection.execute(
+            "SELECT COUNT(*) FROM evaluations"
+        ).fetchone()
+
+        if count <= self.max_entries:
+            return 0
+
+        self._connection.execute(
+            "DELETE FROM evaluations WHERE rowid IN (SELECT rowid FROM evaluations ORDER BY last_used LIMIT ?)",
+            (count - self.max_entries,),
+        )
+        self._connection.commit()
+
+        return int(count) - self.max_entries
+
+    def flush(self) -> None:
+        """Write the pending changes in a single transaction"""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self._spec_hash, key, *result)
+                    for key, result in self._pending_results.items()
+                ],
+            )
+            self._connection.executemany(
+                "UPDATE evaluations SET last_used = ? WHERE spec_hash = ? AND layout = ?",
+                [
+                    (last_used, self._spec_hash, key)
+                    for key, last_used in self._pending_uses.items()
+                ],
+            )
+
+        self._pending_results.clear()
+        self._pending_uses.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+    def hit_rate(self) -> float:
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
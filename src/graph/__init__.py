@@ -1,5 +1,4 @@
-""" Graph module
-"""
+"""Graph module"""
 
 from __future__ import annotations
 from enum import Enum
@@ -94,7 +93,7 @@ class StationNode(DirectedGraphNode):
             grid_params (model.GridParams): _description_
         """
         self.position = model.Vector(x, y)
-        self.place = model.Vector(x, y)
+        self.place = self.position
         self.center_position = model.Vector(
             x * grid_params.measures.x + grid_params.half_measures.x,
             y * grid_params.measures.y + grid_params.half_measures.y,
@@ -123,9 +122,7 @@ class StorageNode(DirectedGraphNode):
         self.edges: list[RoutingGraphEdge] = []
         self.pathing_edges: list[PathEdge] = []
 
-        self.relative_position: model.Vector[float] = model.Vector(
-            storage.position.x, storage.position.y
-        )
+        self.relative_position: model.Vector[float] = storage.position
 
     def absolute_position(self) -> model.Vector[float]:
         """Get de absolute position of the storage node in the plant grid
@@ -133,7 +130,7 @@ class StorageNode(DirectedGraphNode):
         Returns:
             model.Vector[float]: _description_
         """
-        return self.parent_station.position + self.relative_position
+        return self.parent_station.center_position + self.relative_position
 
     def __str__(self) -> str:
         return f"{self.id}"
@@ -229,7 +226,7 @@ class PathEdge(DirectedGraphEdge):
 
 class TreeNode:
     """
-    Representation of each node of the graph. This node is used in the tree of configurations. It contains the station and the position of the station in the plant. It also contains the previous node and the next nodes. The next nodes are the subsequent configuration decisions made from the current node.
+    Representation of each node of the graph. This node is used in the tree of configurations. It contains the station and the position of the station in the plant, and the previous node, so the placements of a configuration can be followed back to the root. The tree itself is not kept, see support.SearchContext.iterate.
 
     """
 
@@ -240,7 +237,6 @@ class TreeNode:
         previous_node,
     ) -> None:
 
-        self.next: list[TreeNode] = []
         self.previous: TreeNode | None = previous_node
 
         self.station_name: model.StationNameType = station_name
@@ -248,14 +244,3 @@ class TreeNode:
 
     def __str__(self) -> str:
         return f"({self.station_name}-{self.position})"
-
-    def count_leaves(self) -> int:
-        if self.next is None:
-            return 1
-
-        count = 0
-
-        for node in self.next:
-            count += node.count_leaves()
-
-        return count
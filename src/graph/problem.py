@@ -1,8 +1,15 @@
 from __future__ import annotations
 
+from array import array
+from math import hypot
+
+import numpy as np
+import pyvisgraph as vg
+
 from graph.process import ManufacturingProcessGraph
-from model import tools
-from model.plant_graph import GraphPlant, path_distance
+from model import StationModel, StationNameType, tools
+from model.plant_graph import GraphPlant
+from model.plant_state import UNPLACED_CELL, GridBitboard
 
 from . import (
     TreeNode,
@@ -11,23 +18,6 @@ from . import (
 from model import Vector
 
 
-def get_hash_for_new_node(node: TreeNode, previous_node: TreeNode):
-    previous_node_evaluated = previous_node
-    hash_set: set[str] = set()
-
-    hash_set.add(node.station.name + str(node.position))
-
-    while True:
-        hash_set.add(
-            previous_node_evaluated.station.name + str(previous_node_evaluated.position)
-        )
-        if previous_node_evaluated.previous is None:
-            break
-        previous_node_evaluated = previous_node_evaluated.previous
-
-    return hash_set
-
-
 def create_plant_from_node_with_station_models_used(
     node: TreeNode, system_specification: tools.SystemSpecification
 ) -> tuple[GraphPlant, set[str]]:
@@ -37,17 +27,17 @@ def create_plant_from_node_with_station_models_used(
     while True:
 
         plant.set_station_location_by_name(
-            node_evaluated.station.name, node_evaluated.position
+            node_evaluated.station_name, node_evaluated.position
         )
 
-        station_models_used.add(node_evaluated.station.name)
+        station_models_used.add(node_evaluated.station_name)
 
         if node_evaluated.previous is None:
             break
 
         node_evaluated = node_evaluated.previous
 
-    plant.ready()
+    plant.set_ready()
 
     return plant, station_models_used
 
@@ -66,19 +56,56 @@ def evaluate_robot_penalties(robot: Vector, origin: Vector, destiny: Vector):
     )
 
 
+def storage_distance_matrices(
+    plant: GraphPlant, storage_positions: np.ndarray
+) -> dict[str, np.ndarray]:
+    """Get the shortest path distances between all the storage nodes in the visibility graph of each transport station
+
+    Each matrix is indexed by the storage ids of the CompiledProcessGraph, as storage_positions, storages in the same position share their distances.
+    """
+    point_indexes: dict[vg.Point, int] = {}
+    storage_point_indexes: list[int] = []
+
+    for x, y in storage_positions.tolist():
+        point = vg.Point(x, y)
+        storage_point_indexes.append(
+            point_indexes.setdefault(point, len(point_indexes))
+        )
+
+    points = list(point_indexes)
+    storage_grid = np.ix_(storage_point_indexes, storage_point_indexes)
+
+    return {
+        transport_name: plant.distance_matrix_with_transport(points, transport_name)[
+            storage_grid
+        ]
+        for transport_name in plant._vis_graphs.keys()
+    }
+
+
 def check_configuration_v2(
     plant: GraphPlant,
     graph: ManufacturingProcessGraph,
+    reach_tables: ReachTables | None = None,
 ) -> float:
 
     result = 0
 
-    graph.reset_positions()
+    # The graph is not modified, the positions of the configuration are kept in arrays indexed by the compiled ids
+    compiled = graph.compiled
+
+    places = compiled.station_places(plant.stations())
 
-    for station_name, place in plant.stations_without_storage().items():
-        for node in graph.station_nodes:
-            if node.model.name == station_name:
-                node.position.set(place.x, place.y)
+    # Leaves whose subtree was fully deduplicated may not have every station placed
+    if places is None:
+        return False
+
+    # Configurations with a routing edge out of range even without the other stations don't need the visibility graphs
+    if reach_tables is not None and reach_tables.rejects(places):
+        return False
+
+    centers = compiled.station_centers(places, plant._grid_params)
+    storage_positions = compiled.storage_positions(centers)
 
     plant.build_vis_graphs()
     """
@@ -93,26 +120,47 @@ def check_configuration_v2(
 
     Here we are going to iterate through all the edges, check the distance between the origin and the destiny and return false is any distance is bigger than the robot range
     """
-    for edge in graph.routing_edges:
+    for transport_id in compiled.transport_ids():
+        transport_name = compiled.station_names[transport_id]
+        transport_range = float(compiled.transport_ranges[transport_id])
+        center = Vector(*centers[transport_id].tolist())
 
         # The position of both the origin and the destiny have to be outside a poligon to be reachable
 
-        if plant._vis_graphs[edge.transport.model.name].point_in_polygon(
-            edge.transport.position
-        ):
+        if plant.is_point_in_obstacles(center, transport_name):
             return False
 
-        assert edge.transport.model.transports
+        # Each storage is checked once, even if several edges of the transport station reach it
+        storage_ids = np.unique(
+            compiled.routing_storages[compiled.station_routing_edges(transport_id)]
+        )
+        ends = storage_positions[storage_ids]
 
-        if edge.transport.model.transports.range < path_distance(
-            plant.get_path_between_two_points_with_transport(
-                edge.transport.center_position,
-                edge.storage.absolute_position(),
-                edge.transport.model.name,
-            )
-        ):  # type: ignore
+        # No path is shorter than the straight line, and it is the shortest path when it doesn't touch any obstacle
+        straight_distances = np.sqrt(
+            (center.x - ends[:, 0]) ** 2 + (center.y - ends[:, 1]) ** 2
+        )
+        if np.any(straight_distances * (1 - BOUND_TOLERANCE) > transport_range):
             return False
 
+        clear = plant.are_segments_clear(center, ends, transport_name)
+        if np.any(straight_distances[clear] > transport_range):
+            return False
+
+        for x, y in ends[~clear].tolist():
+            try:
+                transport_distance = (
+                    plant.get_distance_between_two_points_with_transport(
+                        center, Vector(x, y), transport_name
+                    )
+                )
+            except (KeyError, UnboundLocalError):
+                # pyvisgraph raises when the destination can't be reached or the geometry is degenerate
+                return False
+
+            if transport_range < transport_distance:
+                return False
+
     result = 0
 
     """
@@ -126,19 +174,339 @@ def check_configuration_v2(
     We are going to iterate through all the edges, check the distance between the robot and the origin, or the robot and the destiny, to check if the robot can do the path
     """
 
-    for transport_name in plant._vis_graphs.keys():
-        for edge in graph.pathing_edges:
+    for distances in storage_distance_matrices(plant, storage_positions).values():
+        stations_distances = distances[
+            compiled.pathing_origins, compiled.pathing_destinies
+        ]
+
+        if np.any(stations_distances == np.inf):
+            return False
+
+        # Added one by one, in the order of the edges, so the result doesn't depend on the summation algorithm
+        result = sum(stations_distances.tolist(), result)
+
+    return result
+
+
+# Relative margin for the rounding differences between the bound and the path distances
+BOUND_TOLERANCE = 1e-9
+
 
-            stations_distance: float = path_distance(
-                plant.get_path_between_two_points_with_transport(
-                    edge.origin.absolute_position(),
-                    edge.destiny.absolute_position(),
-                    transport_name,
+class PathingLowerBound:
+    """Admissible lower bound of the check_configuration_v2 result for partial configurations
+
+    check_configuration_v2 adds the length of the shortest path of every pathing edge in the visibility graph of every transport station. No path is shorter than the straight line between its ends, and placing more stations only adds obstacles, so the sum of the euclidean distances of the pathing edges whose stations are both placed, times the number of transport stations, is never greater than the result of any configuration that extends the partial one.
+    """
+
+    def __init__(
+        self, graph: ManufacturingProcessGraph, spec: tools.SystemSpecification
+    ) -> None:
+        grid = spec.model.stations.grid
+        compiled = graph.compiled
+
+        self._cells_count = grid.size.x * grid.size.y
+
+        # Center of each grid cell, in the same order as the packed cells
+        self._cell_centers = np.array(
+            [
+                (
+                    x * grid.measures.x + grid.half_measures.x,
+                    y * grid.measures.y + grid.half_measures.y,
+                )
+                for x in range(grid.size.x)
+                for y in range(grid.size.y)
+            ],
+            dtype=float,
+        )
+
+        # Stations of the ends of each pathing edge, and the offset between the storages of the ends
+        self._origin_stations = compiled.storage_stations[compiled.pathing_origins]
+        self._destiny_stations = compiled.storage_stations[compiled.pathing_destinies]
+        self._storage_offsets = (
+            compiled.storage_offsets[compiled.pathing_origins]
+            - compiled.storage_offsets[compiled.pathing_destinies]
+        )
+
+        self._transports_count = sum(
+            1
+            for station_model in spec.model.stations.models.values()
+            if station_model.transports is not None
+        )
+
+    def __call__(self, station_cells: array) -> float:
+        """Get the lower bound of a packed configuration, see PlantState"""
+        cells = np.frombuffer(station_cells, dtype=np.uint16)
+        origin_cells = cells[self._origin_stations]
+        destiny_cells = cells[self._destiny_stations]
+
+        # Stations in the storage buffer or not placed yet don't add anything
+        placed = (origin_cells < self._cells_count) & (
+            destiny_cells < self._cells_count
+        )
+
+        offsets = (
+            self._cell_centers[origin_cells[placed]]
+            - self._cell_centers[destiny_cells[placed]]
+            + self._storage_offsets[placed]
+        )
+
+        return (
+            float(np.hypot(offsets[:, 0], offsets[:, 1]).sum()) * self._transports_count
+        )
+
+    def prunes(self, station_cells: array, incumbent: float) -> bool:
+        """Check if no configuration extending the packed one can be better than the incumbent result"""
+        return self(station_cells) * (1 - BOUND_TOLERANCE) >= incumbent
+
+
+class FeasibilityChecker:
+    """Necessary conditions of check_configuration_v2 for partial configurations
+
+    check_configuration_v2 rejects a configuration when the shortest path between a transport station and the storage of any routing edge is longer than the transport range. No path is shorter than the straight line, so a routing edge is unreachable for good when both stations are placed and their straight line distance is out of range, or when one of them is placed and none of the cells where the other one can still be placed is in range. Stations can only be placed in the free cells connected to the placed ones, so a configuration with fewer connected free cells than stations left to place is rejected too.
+
+    For each routing edge and transport cell, the reachable storage station cells are precomputed as a bitboard mask, and the other way around.
+    """
+
+    def __init__(
+        self, graph: ManufacturingProcessGraph, spec: tools.SystemSpecification
+    ) -> None:
+        grid = spec.model.stations.grid
+        compiled = graph.compiled
+
+        self._bitboard = GridBitboard.for_size(grid.size.x, grid.size.y)
+        self._stations_count = len(compiled.station_names)
+
+        cell_centers = np.array(
+            [
+                (
+                    x * grid.measures.x + grid.half_measures.x,
+                    y * grid.measures.y + grid.half_measures.y,
+                )
+                for x in range(grid.size.x)
+                for y in range(grid.size.y)
+            ],
+            dtype=float,
+        )
+
+        # (transport index, storage station index, storage cells in range of each transport cell, transport cells in range of each storage cell)
+        self._edges: list[tuple[int, int, list[int], list[int]]] = []
+
+        for transport_id, storage_id in zip(
+            compiled.routing_transports.tolist(), compiled.routing_storages.tolist()
+        ):
+            reach = compiled.transport_ranges[transport_id] * (1 + BOUND_TOLERANCE)
+
+            # Storage position in each storage cell minus each transport cell center, indexed by [transport cell, storage cell]
+            offsets = (
+                cell_centers[np.newaxis, :, :]
+                + compiled.storage_offsets[storage_id]
+                - cell_centers[:, np.newaxis, :]
+            )
+            in_range = np.hypot(offsets[..., 0], offsets[..., 1]) <= reach
+
+            self._edges.append(
+                (
+                    transport_id,
+                    int(compiled.storage_stations[storage_id]),
+                    _row_masks(in_range),
+                    _row_masks(in_range.T),
                 )
             )
-            result += stations_distance
 
-    return result
+    def free_cells(self, occupancy: int) -> int:
+        """Get the mask of free station cells connected to the occupied cells, where the next stations can be placed"""
+        free_mask = self._bitboard.stations_mask & ~occupancy
+        mask = self._bitboard.adjacent_mask(occupancy)
+
+        while True:
+            grown_mask = mask | (self._bitboard.neighbours_mask(mask) & free_mask)
+            if grown_mask == mask:
+                return mask
+            mask = grown_mask
+
+    def rejects(self, station_cells: array, occupancy: int, placed_count: int) -> bool:
+        """Check if no configuration extending the packed one can pass check_configuration_v2"""
+        cells_count = self._bitboard.cells_count
+        free_cells = self.free_cells(occupancy)
+
+        if free_cells.bit_count() < self._stations_count - placed_count:
+            return True
+
+        for (
+            transport_index,
+            storage_index,
+            storage_masks,
+            transport_masks,
+        ) in self._edges:
+            transport_cell = station_cells[transport_index]
+            storage_cell = station_cells[storage_index]
+
+            # Stations in the storage buffer are not checked
+            transport_placed = transport_cell < cells_count
+            storage_placed = storage_cell < cells_count
+
+            if transport_placed and storage_placed:
+                if not storage_masks[transport_cell] >> storage_cell & 1:
+                    return True
+            elif transport_placed and storage_cell == UNPLACED_CELL:
+                if not storage_masks[transport_cell] & free_cells:
+                    return True
+            elif storage_placed and transport_cell == UNPLACED_CELL:
+                if not transport_masks[storage_cell] & free_cells:
+                    return True
+
+        return False
+
+
+class ReachTables:
+    """Path lengths from each transport station model to the storages of each other station model, with only those two stations in the grid
+
+    The shadow of each obstacle in the visibility graph of a transport station is computed from the transport station alone, so placing more stations only adds obstacles and the path length with two stations is a lower bound of the path length in any configuration with both of them at the same relative offset. check_configuration_v2 uses it to reject the configurations with a routing edge out of range before building their visibility graphs.
+
+    Each table is indexed by the storage and by the offset of the storage station cell from the transport station cell, shifted by the grid size to be non negative. Offsets with every storage out of range in a straight line only store the straight line distances, and the lengths that pyvisgraph can't compute are NaN, so they never reject a configuration.
+    """
+
+    def __init__(
+        self, graph: ManufacturingProcessGraph, spec: tools.SystemSpecification
+    ) -> None:
+        grid = spec.model.stations.grid
+        self._shift = Vector(grid.size.x - 1, grid.size.y - 1)
+
+        self.tables: dict[tuple[StationNameType, StationNameType], np.ndarray] = {}
+
+        for transport_model in spec.model.stations.models.values():
+            if transport_model.transports is None:
+                continue
+            for station_model in spec.model.stations.models.values():
+                if station_model.storages is None or station_model is transport_model:
+                    continue
+                self.tables[(transport_model.name, station_model.name)] = (
+                    self._reach_table(spec, transport_model, station_model)
+                )
+
+        # Routing edges of the compiled graph, the storages of the transport station itself are not tabulated
+        compiled = graph.compiled
+        storage_ids = compiled.routing_storages
+        station_ids = compiled.storage_stations[storage_ids]
+        tabulated = station_ids != compiled.routing_transports
+
+        self._transport_ids = compiled.routing_transports[tabulated]
+        self._station_ids = station_ids[tabulated]
+        self._ranges = compiled.transport_ranges[self._transport_ids]
+        # Lengths of the storage of each edge at every offset, (edges, offsets x, offsets y)
+        self._lengths = np.array(
+            [
+                self.tables[
+                    (
+                        compiled.station_names[transport_id],
+                        compiled.station_names[station_id],
+                    )
+                ][compiled.storage_numbers[storage_id]]
+                for transport_id, station_id, storage_id in zip(
+                    self._transport_ids.tolist(),
+                    self._station_ids.tolist(),
+                    storage_ids[tabulated].tolist(),
+                )
+            ],
+            dtype=float,
+        ).reshape(-1, 2 * grid.size.x - 1, 2 * grid.size.y - 1)
+
+    def _reach_table(
+        self,
+        spec: tools.SystemSpecification,
+        transport_model: StationModel,
+        station_model: StationModel,
+    ) -> np.ndarray:
+        assert transport_model.transports and station_model.storages
+
+        grid = spec.model.stations.grid
+        reach = transport_model.transports.range * (1 + BOUND_TOLERANCE)
+
+        table = np.full(
+            (len(station_model.storages), 2 * grid.size.x - 1, 2 * grid.size.y - 1),
+            np.nan,
+        )
+
+        for offset_x in range(-self._shift.x, self._shift.x + 1):
+            for offset_y in range(-self._shift.y, self._shift.y + 1):
+                if offset_x == 0 and offset_y == 0:
+                    continue
+
+                transport_cell = Vector(max(0, -offset_x), max(0, -offset_y))
+                station_cell = Vector(
+                    transport_cell.x + offset_x, transport_cell.y + offset_y
+                )
+
+                transport_center = Vector(
+                    transport_cell.x * grid.measures.x + grid.half_measures.x,
+                    transport_cell.y * grid.measures.y + grid.half_measures.y,
+                )
+                storage_positions = [
+                    Vector(
+                        station_cell.x * grid.measures.x + grid.half_measures.x,
+                        station_cell.y * grid.measures.y + grid.half_measures.y,
+                    )
+                    + storage.position
+                    for storage in station_model.storages
+                ]
+
+                lengths = table[:, offset_x + self._shift.x, offset_y + self._shift.y]
+
+                straight_lengths = [
+                    hypot(
+                        position.x - transport_center.x,
+                        position.y - transport_center.y,
+                    )
+                    for position in storage_positions
+                ]
+
+                if min(straight_lengths) > reach:
+                    lengths[:] = straight_lengths
+                    continue
+
+                plant = GraphPlant(spec)
+                plant.set_station_location_by_name(transport_model.name, transport_cell)
+                plant.set_station_location_by_name(station_model.name, station_cell)
+                plant.set_ready()
+                plant.build_vis_graphs()
+
+                if plant.is_point_in_obstacles(transport_center, transport_model.name):
+                    lengths[:] = np.inf
+                    continue
+
+                for index, position in enumerate(storage_positions):
+                    try:
+                        lengths[index] = (
+                            plant.get_distance_between_two_points_with_transport(
+                                transport_center, position, transport_model.name
+                            )
+                        )
+                    except (KeyError, UnboundLocalError):
+                        pass
+
+        return table
+
+    def rejects(self, places: np.ndarray) -> bool:
+        """Check if any routing edge is out of range, with the station cells of CompiledProcessGraph.station_places"""
+        offsets = (
+            places[self._station_ids]
+            - places[self._transport_ids]
+            + (self._shift.x, self._shift.y)
+        )
+
+        lengths = self._lengths[
+            np.arange(len(self._lengths)), offsets[:, 0], offsets[:, 1]
+        ]
+
+        return bool(np.any(lengths * (1 - BOUND_TOLERANCE) > self._ranges))
+
+
+def _row_masks(matrix: np.ndarray) -> list[int]:
+    """Get each row of a boolean matrix as a bitboard mask of its columns"""
+    return [
+        int.from_bytes(np.packbits(row, bitorder="little").tobytes(), "little")
+        for row in matrix
+    ]
 
 
 def evaluate_plant(
@@ -148,15 +516,14 @@ def evaluate_plant(
 
     result = 0
 
-    graph.reset_positions()
+    compiled = graph.compiled
 
-    for colIndex, column in enumerate(plant._grid):
-        for rowIndex, station in enumerate(iterable=column):
-            if station is None:
-                continue
-            for node in graph.station_nodes:
-                if node.model.name == station.name:
-                    node.position.set(colIndex, rowIndex)
+    places = compiled.station_places(plant.stations())
+    assert places is not None, "All the stations have to be placed in the grid"
+
+    storage_positions = compiled.storage_positions(
+        compiled.station_centers(places, plant._grid_params)
+    )
     """
     There are two possible ways to calculate the performance of the configuration
     Considering that all the edges have to be used, so all the possible paths that the robots can do have to be possible, i.e. all the edges can be used and the distance between robot and all possible nodes have to be under the robot range
@@ -170,17 +537,14 @@ def evaluate_plant(
 
     data_dict = {}
 
-    for transport_name in plant._vis_graphs.keys():
+    for transport_name, distances in storage_distance_matrices(
+        plant, storage_positions
+    ).items():
         data_dict[transport_name] = {}
-        for edge in graph.pathing_edges:
-
-            stations_distance: float = path_distance(
-                plant.get_path_between_two_points_with_transport(
-                    edge.origin.absolute_position(),
-                    edge.destiny.absolute_position(),
-                    transport_name,
-                )
-            )
-            data_dict[transport_name][edge.id] = stations_distance
+        for edge_id, stations_distance in zip(
+            compiled.pathing_edge_ids,
+            distances[compiled.pathing_origins, compiled.pathing_destinies].tolist(),
+        ):
+            data_dict[transport_name][edge_id] = stations_distance
 
     return data_dict
@@ -1,10 +1,13 @@
+from __future__ import annotations
+
 import itertools
-from typing import Callable, List, get_origin
+from typing import Callable, Iterator, List, Mapping, Optional, get_origin
 
+import numpy as np
 import prettytable
 
-import model, outputs
-from . import PathEdge, StationNode, RoutingGraphEdge
+import model
+from . import PathEdge, StationNode, StorageNode, RoutingGraphEdge
 
 
 class ManufacturingProcessGraph:
@@ -19,6 +22,13 @@ class ManufacturingProcessGraph:
         self.routing_edges: List[RoutingGraphEdge] = []
         self.pathing_edges: List[PathEdge] = []
 
+        # All the storage nodes of the stations, and their index in storage distance matrices
+        self.storage_nodes: List[StorageNode] = []
+        self.storage_indexes: dict[StorageNode, int] = {}
+
+        # Immutable form used to evaluate configurations, built by generate_model_graph
+        self.compiled: CompiledProcessGraph
+
         self.system_model = system_model
 
     def generate_model_graph(self) -> None:
@@ -56,100 +66,111 @@ class ManufacturingProcessGraph:
         for station in self.system_model.stations.models.values():
             nodes.append(StationNode(station))
 
-        # Then we are going to add edges to the nodes. All edges are going from/to a transport station to/from a storage station. We are going to iterate over the nodes and add the edges to all the other nodes available.
+        # Then we are going to add edges to the nodes. All edges are going from/to a transport station to/from a storage station.
+
+        # Storage types of all the stations indexed by part, in the order of the stations, their storages and their types
+        storage_types_by_part: dict[
+            str, list[tuple[int, StationNode, StorageNode, model.StorageType]]
+        ] = {}
+
+        sequence = itertools.count()
+        for station_node in nodes:
+            for storage_node in station_node.storage_nodes:
+                for storage_type in storage_node.model.type:
+                    storage_types_by_part.setdefault(storage_type.part, []).append(
+                        (next(sequence), station_node, storage_node, storage_type)
+                    )
+
+        # Edges already added, as (part, transport, storage, direction)
+        routing_keys: set[
+            tuple[str, StationNode, StorageNode, RoutingGraphEdge.Direction]
+        ] = set()
 
         for transport_node in nodes:
 
             if transport_node.model.transports is None:
                 continue
 
-            for storage_station_node in nodes:
-                if storage_station_node.model.storages is None:
-                    continue
-
-                for storage_node in storage_station_node.storage_nodes:
-                    for storage_type in storage_node.model.type:
-
-                        if storage_type.part in transport_node.model.transports.parts:
-
-                            if storage_type.add == 1:
-                                new_edge = RoutingGraphEdge(
-                                    storage_type.part,
-                                    transport_node,
-                                    storage_node,
-                                    RoutingGraphEdge.Direction.INPUT,
-                                )
-                                if new_edge not in transport_node.edges:
-                                    storage_node.edges.append(new_edge)
-                                    transport_node.edges.append(new_edge)
-                                    self.routing_edges.append(new_edge)
-
-                            if storage_type.remove == 1:
-                                new_edge = RoutingGraphEdge(
-                                    storage_type.part,
-                                    transport_node,
-                                    storage_node,
-                                    RoutingGraphEdge.Direction.OUTPUT,
-                                )
-                                if new_edge not in transport_node.edges:
-                                    storage_node.edges.append(new_edge)
-                                    transport_node.edges.append(new_edge)
-                                    self.routing_edges.append(new_edge)
+            # Storage types of the transported parts, in the same order as the storage types of all the stations
+            transported_storage_types = sorted(
+                itertools.chain.from_iterable(
+                    storage_types_by_part.get(part, [])
+                    for part in set(transport_node.model.transports.parts)
+                ),
+                key=lambda entry: entry[0],
+            )
+
+            for _, _, storage_node, storage_type in transported_storage_types:
+                for enabled, direction in (
+                    (storage_type.add, RoutingGraphEdge.Direction.INPUT),
+                    (storage_type.remove, RoutingGraphEdge.Direction.OUTPUT),
+                ):
+                    if enabled != 1:
+                        continue
+
+                    key = (storage_type.part, transport_node, storage_node, direction)
+                    if key in routing_keys:
+                        continue
+                    routing_keys.add(key)
+
+                    new_edge = RoutingGraphEdge(
+                        storage_type.part, transport_node, storage_node, direction
+                    )
+                    storage_node.edges.append(new_edge)
+                    transport_node.edges.append(new_edge)
+                    self.routing_edges.append(new_edge)
 
         self.station_nodes = nodes
 
+        self.storage_nodes = [
+            storage_node for node in nodes for storage_node in node.storage_nodes
+        ]
+        self.storage_indexes = {
+            storage_node: index for index, storage_node in enumerate(self.storage_nodes)
+        }
+
         # Now we have to generate the path edges, which represent the routes between storage positions.
 
-        # Loop over the pair of each station storage nodes and all the other storage nodes from the other stations
+        # Edges already added, as (part, origin, destiny)
+        pathing_keys: set[tuple[str, StorageNode, StorageNode]] = set()
+
+        def add_pathing_edge(
+            part: str, origin: StorageNode, destiny: StorageNode
+        ) -> None:
+            key = (part, origin, destiny)
+            if key in pathing_keys:
+                return
+            pathing_keys.add(key)
+
+            new_edge = PathEdge(part, origin, destiny)
+            origin.pathing_edges.append(new_edge)
+            destiny.pathing_edges.append(new_edge)
+            self.pathing_edges.append(new_edge)
+
+        # Pair each storage type with the storage types of the same part in the other stations
         for station_node in nodes:
-            station_node = station_node
-            if station_node.model.storages is None:
-                continue
             for storage_node in station_node.storage_nodes:
                 for storage_type in storage_node.model.type:
-                    # For each storage_type in each storage_node of each station_node
-
-                    # Inner loop over all storage nodes of all the stations except the station_node
-                    for other_station_node in nodes:
+                    for (
+                        _,
+                        other_station_node,
+                        other_storage_node,
+                        other_storage_type,
+                    ) in storage_types_by_part[storage_type.part]:
                         if other_station_node == station_node:
                             continue
-                        other_storage_station_node = other_station_node
-                        if other_storage_station_node.model.storages is None:
-                            continue
-                        for other_storage_node in other_station_node.storage_nodes:
-                            for other_storage_type in other_storage_node.model.type:
-
-                                # For each other_storage_type in each other_storage_node of each other_station_node
-                                if storage_type.part != other_storage_type.part:
-                                    continue
-
-                                if storage_type.add and other_storage_type.remove:
-                                    new_edge = PathEdge(
-                                        storage_type.part,
-                                        other_storage_node,
-                                        storage_node,
-                                    )
-
-                                    if new_edge not in storage_node.pathing_edges:
-                                        storage_node.pathing_edges.append(new_edge)
-                                        other_storage_node.pathing_edges.append(
-                                            new_edge
-                                        )
-                                        self.pathing_edges.append(new_edge)
-
-                                if storage_type.remove and other_storage_type.add:
-                                    new_edge = PathEdge(
-                                        storage_type.part,
-                                        storage_node,
-                                        other_storage_node,
-                                    )
-
-                                    if new_edge not in storage_node.pathing_edges:
-                                        storage_node.pathing_edges.append(new_edge)
-                                        other_storage_node.pathing_edges.append(
-                                            new_edge
-                                        )
-                                        self.pathing_edges.append(new_edge)
+
+                        if storage_type.add and other_storage_type.remove:
+                            add_pathing_edge(
+                                storage_type.part, other_storage_node, storage_node
+                            )
+
+                        if storage_type.remove and other_storage_type.add:
+                            add_pathing_edge(
+                                storage_type.part, storage_node, other_storage_node
+                            )
+
+        self.compiled = CompiledProcessGraph(self)
 
     def reset_positions(self) -> None:
         for node in self.station_nodes:
@@ -173,6 +194,8 @@ class ManufacturingProcessGraph:
         self.print_directed_graph_table(self.station_nodes)
 
     def export(self, name) -> None:
+        import outputs
+
         get_origin_id: Callable[[RoutingGraphEdge], str] = lambda edge: (
             edge.transport.id
             if edge.direction == RoutingGraphEdge.Direction.INPUT
@@ -232,6 +255,174 @@ class ManufacturingProcessGraph:
         print(nodes_table)
 
 
+class CompiledProcessGraph:
+    """Immutable array form of a ManufacturingProcessGraph
+
+    Stations are identified by their index in the spec models, storages by their index in ManufacturingProcessGraph.storage_nodes, parts by their index in part_names and edges by their index in the edge arrays. The adjacency of the stations to their routing edges is stored in CSR form: the routing edges of station i are routing_edges[routing_offsets[i]:routing_offsets[i + 1]].
+
+    The positions of a configuration are kept apart in arrays indexed by those ids, so the same instance can evaluate configurations concurrently.
+    """
+
+    def __init__(self, graph: ManufacturingProcessGraph) -> None:
+        self.station_names: tuple[model.StationNameType, ...] = tuple(
+            node.model.name for node in graph.station_nodes
+        )
+        station_ids = {node: index for index, node in enumerate(graph.station_nodes)}
+
+        # Range of each station, NaN for the stations without transports
+        self.transport_ranges = _read_only(
+            np.array(
+                [
+                    (
+                        node.model.transports.range
+                        if node.model.transports is not None
+                        else np.nan
+                    )
+                    for node in graph.station_nodes
+                ],
+                dtype=float,
+            )
+        )
+
+        part_ids: dict[str, int] = {}
+        for part in itertools.chain(
+            (edge.part for edge in graph.routing_edges),
+            (edge.part for edge in graph.pathing_edges),
+        ):
+            part_ids.setdefault(part, len(part_ids))
+        self.part_names: tuple[str, ...] = tuple(part_ids)
+
+        self.storage_stations = _read_only(
+            np.array(
+                [station_ids[node.parent_station] for node in graph.storage_nodes],
+                dtype=np.intp,
+            )
+        )
+        # Index of each storage in the storages of its station model
+        self.storage_numbers = _read_only(
+            np.array(
+                [
+                    node.parent_station.storage_nodes.index(node)
+                    for node in graph.storage_nodes
+                ],
+                dtype=np.intp,
+            )
+        )
+        self.storage_offsets = _read_only(
+            np.array(
+                [
+                    [node.relative_position.x, node.relative_position.y]
+                    for node in graph.storage_nodes
+                ],
+                dtype=float,
+            ).reshape(-1, 2)
+        )
+
+        # Routing edges, in the order of the graph
+        self.routing_transports = _read_only(
+            np.array(
+                [station_ids[edge.transport] for edge in graph.routing_edges],
+                dtype=np.intp,
+            )
+        )
+        self.routing_storages = _read_only(
+            np.array(
+                [graph.storage_indexes[edge.storage] for edge in graph.routing_edges],
+                dtype=np.intp,
+            )
+        )
+        self.routing_parts = _read_only(
+            np.array(
+                [part_ids[edge.part] for edge in graph.routing_edges], dtype=np.intp
+            )
+        )
+        self.routing_offsets, self.routing_edges = _csr(
+            self.routing_transports, len(self.station_names)
+        )
+
+        # Pathing edges, with their ids for the reports
+        self.pathing_origins = _read_only(
+            np.array(
+                [graph.storage_indexes[edge.origin] for edge in graph.pathing_edges],
+                dtype=np.intp,
+            )
+        )
+        self.pathing_destinies = _read_only(
+            np.array(
+                [graph.storage_indexes[edge.destiny] for edge in graph.pathing_edges],
+                dtype=np.intp,
+            )
+        )
+        self.pathing_parts = _read_only(
+            np.array(
+                [part_ids[edge.part] for edge in graph.pathing_edges], dtype=np.intp
+            )
+        )
+        self.pathing_edge_ids: tuple[str, ...] = tuple(
+            edge.id for edge in graph.pathing_edges
+        )
+
+    def transport_ids(self) -> Iterator[int]:
+        """Get the ids of the stations with routing edges"""
+        return (
+            station_id
+            for station_id in range(len(self.station_names))
+            if self.routing_offsets[station_id] < self.routing_offsets[station_id + 1]
+        )
+
+    def station_routing_edges(self, station_id: int) -> np.ndarray:
+        """Get the routing edges of a station, in the order of the graph"""
+        return self.routing_edges[
+            self.routing_offsets[station_id] : self.routing_offsets[station_id + 1]
+        ]
+
+    def station_places(
+        self, locations: Mapping[model.StationNameType, model.Vector[int] | int]
+    ) -> Optional[np.ndarray]:
+        """Get the grid cell of each station as a (stations, 2) array, see BasePlant.stations
+
+        Returns:
+            Optional[np.ndarray]: None when any station is not placed in the grid
+        """
+        places = np.empty((len(self.station_names), 2), dtype=np.intp)
+
+        for station_id, name in enumerate(self.station_names):
+            location = locations[name]
+            if isinstance(location, int) or location.x == -1:
+                return None
+            places[station_id] = (location.x, location.y)
+
+        return places
+
+    @staticmethod
+    def station_centers(
+        places: np.ndarray, grid_params: model.GridParams
+    ) -> np.ndarray:
+        """Get the center of the cell of each station"""
+        return places * (grid_params.measures.x, grid_params.measures.y) + (
+            grid_params.half_measures.x,
+            grid_params.half_measures.y,
+        )
+
+    def storage_positions(self, centers: np.ndarray) -> np.ndarray:
+        """Get the absolute position of each storage from the station centers"""
+        positions: np.ndarray = centers[self.storage_stations] + self.storage_offsets
+        return positions
+
+
+def _read_only(values: np.ndarray) -> np.ndarray:
+    values.setflags(write=False)
+    return values
+
+
+def _csr(sources: np.ndarray, nodes_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Get the offsets and the edges of each source node, the edges of a node keep their order"""
+    edges = np.argsort(sources, kind="stable")
+    offsets = np.zeros(nodes_count + 1, dtype=np.intp)
+    np.cumsum(np.bincount(sources, minlength=nodes_count), out=offsets[1:])
+    return _read_only(offsets), _read_only(edges.astype(np.intp))
+
+
 if __name__ == "__main__":
     import model.tools
 
@@ -0,0 +1,180 @@
+from itertools import combinations
+import os
+import unittest
+
+import numpy as np
+import yaml
+
+from graph import TreeNode
+from graph.problem import (
+    BOUND_TOLERANCE,
+    FeasibilityChecker,
+    PathingLowerBound,
+    ReachTables,
+    _row_masks,
+    check_configuration_v2,
+)
+from graph.process import ManufacturingProcessGraph
+from model import Vector
+from model.plant_graph import GraphPlant
+from model.plant_state import UNPLACED_CELL
+from model.tools import SystemSpecification
+from support import SearchContext
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "model.yaml")
+
+
+def small_model_spec() -> SystemSpecification:
+    """Get model.yaml on a 3x3 grid, with transport ranges that make some configurations valid and others out of range"""
+    with open(MODEL_PATH, encoding="utf8") as model_file:
+        model_dict = yaml.safe_load(model_file)
+
+    model_dict["Stations"]["Grid"]["Size"] = {"X": 3, "Y": 3}
+    for station_dict in model_dict["Stations"]["Models"].values():
+        if "Transport" in station_dict:
+            station_dict["Transport"]["Range"] = 2.0
+
+    return SystemSpecification(model_string=yaml.dump(model_dict))
+
+
+class TestProblem(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.spec = small_model_spec()
+        cls.flow_graph = ManufacturingProcessGraph(cls.spec.model)
+        cls.flow_graph.generate_model_graph()
+
+        # Every complete configuration and its result
+        cls.configurations = list(
+            SearchContext().iterate(
+                TreeNode("InOut", Vector(2, 0), None),
+                cls.spec.model.stations.models,
+                cls.spec,
+            )
+        )
+        plant = GraphPlant(cls.spec)
+        cls.results = []
+        for state in cls.configurations:
+            plant.import_state(state)
+            plant.set_ready()
+            cls.results.append(check_configuration_v2(plant, cls.flow_graph))
+
+    def test_lower_bound(self):
+        """The bound of a valid configuration, and of the partial configurations it extends, is never greater than its result"""
+        lower_bound = PathingLowerBound(self.flow_graph, self.spec)
+        valid_count = 0
+
+        for state, result in zip(self.configurations, self.results):
+            if not result:
+                continue
+            valid_count += 1
+
+            cells = state.station_cells()
+            self.assertGreater(lower_bound(cells), 0)
+            self.assertLessEqual(lower_bound(cells), result * (1 + BOUND_TOLERANCE))
+
+            for index in range(len(cells)):
+                partial_cells = state.station_cells()
+                partial_cells[index] = UNPLACED_CELL
+                self.assertLessEqual(lower_bound(partial_cells), lower_bound(cells))
+
+        self.assertGreater(valid_count, 0)
+
+    def test_feasibility_rejects_invalid_configurations(self):
+        """A configuration extending a partial configuration rejected by the feasibility checker is never valid"""
+        feasibility = FeasibilityChecker(self.flow_graph, self.spec)
+        cells_count = self.spec.model.stations.grid.size.x * (
+            self.spec.model.stations.grid.size.y
+        )
+        root_index = list(self.spec.model.stations.models).index("InOut")
+        rejected_count = 0
+
+        for state, result in zip(self.configurations, self.results):
+            # The root station stays placed, any subset of the other ones is a partial configuration that the complete one extends
+            placements = [
+                placement
+                for placement in state.placements()
+                if placement[0] != root_index
+            ]
+
+            for size in range(len(placements) + 1):
+                for subset in combinations(placements, size):
+                    partial_cells = state.station_cells()
+                    for station_index, _ in placements:
+                        partial_cells[station_index] = UNPLACED_CELL
+
+                    for station_index, cell in subset:
+                        partial_cells[station_index] = cell
+
+                    occupancy = 0
+                    for cell in partial_cells:
+                        if cell < cells_count:
+                            occupancy |= 1 << cell
+
+                    if feasibility.rejects(partial_cells, occupancy, size + 1):
+                        rejected_count += 1
+                        self.assertFalse(result)
+
+        self.assertGreater(rejected_count, 0)
+
+    def test_feasibility_keeps_the_best_result(self):
+        """The search finds the same best configuration with and without the feasibility checker"""
+        best_results = []
+
+        for feasibility in (None, FeasibilityChecker(self.flow_graph, self.spec)):
+            context = SearchContext()
+            context.check_configurations(
+                context.iterate(
+                    TreeNode("InOut", Vector(2, 0), None),
+                    self.spec.model.stations.models,
+                    self.spec,
+                    feasibility=feasibility,
+                ),
+                self.flow_graph,
+                self.spec,
+            )
+            best_results.append(
+                (context.best_performance_ratio, context.best_performance_state)
+            )
+
+        self.assertEqual(best_results[0], best_results[1])
+        self.assertEqual(
+            best_results[0][0], min(result for result in self.results if result)
+        )
+
+    def test_reach_tables_keep_valid_configurations(self):
+        """The reach tables only reject configurations that check_configuration_v2 rejects without them"""
+        reach_tables = ReachTables(self.flow_graph, self.spec)
+        plant = GraphPlant(self.spec)
+        rejected_count = 0
+
+        for state, result in zip(self.configurations, self.results):
+            plant.import_state(state)
+            plant.set_ready()
+            places = self.flow_graph.compiled.station_places(plant.stations())
+            assert places is not None
+
+            if reach_tables.rejects(places):
+                rejected_count += 1
+                self.assertFalse(result)
+            else:
+                self.assertEqual(
+                    check_configuration_v2(plant, self.flow_graph, reach_tables),
+                    result,
+                )
+
+        self.assertGreater(rejected_count, 0)
+
+    def test_row_masks(self):
+        """Each mask has the bits of the true columns of its row"""
+        matrix = np.random.default_rng(0).random((5, 70)) < 0.5
+
+        for row, mask in zip(matrix, _row_masks(matrix)):
+            self.assertEqual(
+                mask, sum(1 << column for column in np.flatnonzero(row).tolist())
+            )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
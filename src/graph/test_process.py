@@ -0,0 +1,134 @@
+import math
+import os
+import unittest
+
+from graph.process import ManufacturingProcessGraph
+from model.plant_graph import GraphPlant
+from model.test_plant_graph import LAYOUTS
+from model.tools import SystemSpecification
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "model.yaml")
+
+
+class TestCompiledProcessGraph(unittest.TestCase):
+
+    def setUp(self) -> None:
+        with open(MODEL_PATH, encoding="utf8") as model_file:
+            self.spec = SystemSpecification(model_stream=model_file)
+        self.graph = ManufacturingProcessGraph(self.spec.model)
+        self.graph.generate_model_graph()
+        self.compiled = self.graph.compiled
+
+    def test_stations_and_storages(self):
+        """Each station and storage id is the index of its node in the graph"""
+        graph, compiled = self.graph, self.compiled
+
+        self.assertEqual(
+            compiled.station_names,
+            tuple(node.model.name for node in graph.station_nodes),
+        )
+        for station_id, node in enumerate(graph.station_nodes):
+            transport_range = compiled.transport_ranges[station_id]
+            if node.model.transports is None:
+                self.assertTrue(math.isnan(transport_range))
+            else:
+                self.assertEqual(transport_range, node.model.transports.range)
+
+        self.assertGreater(len(graph.storage_nodes), 0)
+        for storage_id, node in enumerate(graph.storage_nodes):
+            station_id = compiled.storage_stations[storage_id]
+            self.assertIs(graph.station_nodes[station_id], node.parent_station)
+            self.assertIs(
+                node.parent_station.storage_nodes[compiled.storage_numbers[storage_id]],
+                node,
+            )
+            self.assertEqual(
+                compiled.storage_offsets[storage_id].tolist(),
+                [node.relative_position.x, node.relative_position.y],
+            )
+
+    def test_edges(self):
+        """The edge arrays follow the routing and pathing edges of the graph"""
+        graph, compiled = self.graph, self.compiled
+
+        self.assertGreater(len(graph.routing_edges), 0)
+        for edge_id, edge in enumerate(graph.routing_edges):
+            self.assertIs(
+                graph.station_nodes[compiled.routing_transports[edge_id]],
+                edge.transport,
+            )
+            self.assertIs(
+                graph.storage_nodes[compiled.routing_storages[edge_id]], edge.storage
+            )
+            self.assertEqual(
+                compiled.part_names[compiled.routing_parts[edge_id]], edge.part
+            )
+
+        transport_ids = []
+        for station_id, node in enumerate(graph.station_nodes):
+            edge_ids = [
+                edge_id
+                for edge_id, edge in enumerate(graph.routing_edges)
+                if edge.transport is node
+            ]
+            self.assertEqual(
+                compiled.station_routing_edges(station_id).tolist(), edge_ids
+            )
+            if edge_ids:
+                transport_ids.append(station_id)
+        self.assertEqual(list(compiled.transport_ids()), transport_ids)
+
+        self.assertGreater(len(graph.pathing_edges), 0)
+        for edge_id, edge in enumerate(graph.pathing_edges):
+            self.assertIs(
+                graph.storage_nodes[compiled.pathing_origins[edge_id]], edge.origin
+            )
+            self.assertIs(
+                graph.storage_nodes[compiled.pathing_destinies[edge_id]], edge.destiny
+            )
+            self.assertEqual(
+                compiled.part_names[compiled.pathing_parts[edge_id]], edge.part
+            )
+            self.assertEqual(compiled.pathing_edge_ids[edge_id], edge.id)
+
+        self.assertEqual(
+            len(compiled.part_names),
+            len(
+                {edge.part for edge in graph.routing_edges}
+                | {edge.part for edge in graph.pathing_edges}
+            ),
+        )
+
+    def test_positions(self):
+        """Storage positions are the centers of the station cells plus the storage offsets"""
+        plant = GraphPlant(self.spec)
+        self.assertIsNone(self.compiled.station_places(plant.stations()))
+
+        for station_name, position in LAYOUTS[0].items():
+            plant.set_station_location_by_name(station_name, position)
+
+        places = self.compiled.station_places(plant.stations())
+        assert places is not None
+        storage_positions = self.compiled.storage_positions(
+            self.compiled.station_centers(places, self.spec.model.stations.grid)
+        )
+
+        grid = self.spec.model.stations.grid
+        for storage_id, node in enumerate(self.graph.storage_nodes):
+            cell = LAYOUTS[0][node.parent_station.model.name]
+            self.assertAlmostEqual(
+                storage_positions[storage_id][0],
+                cell.x * grid.measures.x
+                + grid.half_measures.x
+                + node.relative_position.x,
+            )
+            self.assertAlmostEqual(
+                storage_positions[storage_id][1],
+                cell.y * grid.measures.y
+                + grid.half_measures.y
+                + node.relative_position.y,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
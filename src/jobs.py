@@ -0,0 +1,497 @@
+"""Search jobs
+
+Searches submitted to the server run as jobs in a pool of worker processes, so a request only has to submit a model and poll its job. The workers are started with the pool and import the search modules before their first job, then they are reused: each one keeps the models it compiled recently (see model_cache.CompiledModelCache), its visibility graph cache and its own evaluation cache database between jobs. A job is given to an idle worker that already holds its model when there is one, so repeated runs of a model skip the parsing and the precomputations, and reuse the results of the configurations checked before. At most max_workers jobs run at the same time, the rest wait in submission order.
+
+Each worker reports the search metrics (see search_metrics.SearchMetrics), with the best configuration found so far, through its pipe while a job runs, and the result when it ends. Running jobs are cancelled by asking their worker to stop the search, which it does at its next metrics event, so the worker stays warm. A worker that doesn't stop within CANCEL_TIMEOUT is terminated and replaced, each worker has its own pipe so terminating it can't break the reports of the others.
+
+A job whose model can't be parsed ends as invalid with the parse error. Any other error fails the job with the last line of its traceback, the whole traceback is logged.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import Enum
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+from multiprocessing.process import BaseProcess
+import os
+import threading
+import time
+import traceback
+from typing import Any
+import uuid
+
+from model_cache import model_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the checks of the monitor thread
+MONITOR_INTERVAL = 0.5
+
+# Seconds given to a worker to stop a cancelled search before it is terminated
+CANCEL_TIMEOUT = 10
+
+# Finished jobs kept to be queried, the oldest ones are forgotten first
+MAX_FINISHED_JOBS = 100
+
+# Compiled models kept in memory by each worker
+WORKER_MODELS = 4
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    INVALID = "invalid"
+    CANCELLED = "cancelled"
+
+    def finished(self) -> bool:
+        return self not in (JobStatus.PENDING, JobStatus.RUNNING)
+
+
+@dataclass
+class Job:
+    id: str
+    model_text: str
+    status: JobStatus = JobStatus.PENDING
+    progress: dict[str, Any] = field(default_factory=dict)
+    best_configuration: list | None = None
+    result: dict[str, Any] | None = None
+    error: str | None = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    # Incremented on every change of the job, see JobManager.wait_for_update
+    version: int = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the state of the job without the model, as returned by the job API"""
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "progress": self.progress,
+            "best_configuration": self.best_configuration,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+@dataclass(eq=False)
+class _Worker:
+    slot: int
+    process: BaseProcess
+    connection: Connection
+    # Keys of the models compiled by the worker, the most recently used last
+    model_keys: list[str] = field(default_factory=list)
+    # Job run by the worker, it is kept after a cancellation until the worker stops
+    job_id: str | None = None
+    # Time limit to stop a cancelled search
+    cancel_deadline: float | None = None
+    # Set when the worker is terminated, it has been replaced and it is forgotten when its pipe is closed
+    retired: bool = False
+
+    def idle(self) -> bool:
+        return self.job_id is None and not self.retired
+
+
+class JobManager:
+    """Pool of warm search worker processes
+
+    A monitor thread collects the reports of the workers, replaces the workers that exit and gives the pending jobs to the idle workers. The methods can be called from several threads, like the request handlers of the server.
+
+    If evaluation_cache_dir is given, each worker stores the results of the configurations it checks in its own database in that directory, see evaluation_cache.EvaluationCache. The databases are not shared, so the workers never wait for the writes of the others.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        model_cache_dir: str | None = None,
+        evaluation_cache_dir: str | None = None,
+    ) -> None:
+        self.max_workers = max_workers
+        self.model_cache_dir = model_cache_dir
+        self.evaluation_cache_dir = evaluation_cache_dir
+
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._pending: deque[str] = deque()
+        # Pipes of the workers, they are only closed by the monitor thread
+        self._workers: dict[Connection, _Worker] = {}
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+
+        self._context = multiprocessing.get_context()
+
+        self._closed = threading.Event()
+
+        with self._lock:
+            for slot in range(max_workers):
+                self._start_worker(slot)
+
+        self._monitor = threading.Thread(target=self._monitor_jobs, daemon=True)
+        self._monitor.start()
+
+    def submit(self, model_text: str) -> Job:
+        job = Job(uuid.uuid4().hex, model_text)
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job.id)
+            self._start_pending_jobs()
+
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait_for_update(
+        self, job_id: str, version: int, timeout: float | None = None
+    ) -> Job | None:
+        """Wait until the job changes from the given version or the timeout expires
+
+        Returns:
+            Job | None: the job, None if there is no job with that id
+        """
+        with self._updated:
+            self._updated.wait_for(
+                lambda: job_id not in self._jobs
+                or self._jobs[job_id].version != version,
+                timeout,
+            )
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float | None = None) -> Job | None:
+        """Wait until the job finishes or the timeout expires
+
+        Returns:
+            Job | None: the job, None if there is no job with that id
+        """
+        with self._updated:
+            self._updated.wait_for(
+                lambda: job_id not in self._jobs
+                or self._jobs[job_id].status.finished(),
+                timeout,
+            )
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job | None:
+        """Cancel a pending or running job, finished jobs are left as they are
+
+        Returns:
+            Job | None: the job, None if there is no job with that id
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status.finished():
+                return job
+
+            if job.status == JobStatus.PENDING:
+                self._pending.remove(job_id)
+            else:
+                worker = next(
+                    worker
+                    for worker in self._workers.values()
+                    if worker.job_id == job_id and not worker.retired
+                )
+                self._stop_job(worker)
+
+            self._finish(job, JobStatus.CANCELLED)
+
+            return job
+
+    def remove(self, job_id: str) -> Job | None:
+        """Cancel a job if it hasn't finished and forget it"""
+        job = self.cancel(job_id)
+
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._updated.notify_all()
+
+        return job
+
+    def close(self) -> None:
+        """Cancel all the jobs and stop the workers and the monitor thread"""
+        with self._lock:
+            # No more jobs nor workers are started
+            self._closed.set()
+            job_ids = list(self._pending) + [
+                worker.job_id
+                for worker in self._workers.values()
+                if worker.job_id is not None and not worker.retired
+            ]
+
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+        with self._lock:
+            for worker in self._workers.values():
+                worker.process.terminate()
+
+        self._monitor.join()
+
+    def _start_worker(self, slot: int) -> None:
+        evaluation_cache_path = (
+            os.path.join(self.evaluation_cache_dir, f"worker-{slot}.sqlite")
+            if self.evaluation_cache_dir is not None
+            else None
+        )
+
+        connection, worker_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=_run_worker,
+            args=(worker_connection, self.model_cache_dir, evaluation_cache_path),
+            daemon=True,
+        )
+        process.start()
+        # The pipe reaches the end of file when the worker exits
+        worker_connection.close()
+
+        self._workers[connection] = _Worker(slot, process, connection)
+
+    def _start_pending_jobs(self) -> None:
+        if self._closed.is_set():
+            return
+
+        while self._pending:
+            idle_workers = [
+                worker for worker in self._workers.values() if worker.idle()
+            ]
+            if not idle_workers:
+                return
+
+            job = self._jobs[self._pending.popleft()]
+            key = model_key(job.model_text)
+
+            # A worker that holds the model, or else the one that holds the fewest models
+            worker = next(
+                (worker for worker in idle_workers if key in worker.model_keys),
+                min(idle_workers, key=lambda worker: len(worker.model_keys)),
+            )
+
+            # The same bookkeeping as the cache of the worker, it is only a hint for the next jobs
+            if key in worker.model_keys:
+                worker.model_keys.remove(key)
+            worker.model_keys.append(key)
+            del worker.model_keys[:-WORKER_MODELS]
+
+            try:
+                worker.connection.send(("run", job.model_text))
+            except OSError:
+                # The worker has exited, the monitor thread fails the job when it finds it
+                pass
+
+            worker.job_id = job.id
+            job.status = JobStatus.RUNNING
+            job.started_at = time.time()
+            self._touch(job)
+
+    def _stop_job(self, worker: _Worker) -> None:
+        """Ask a worker to stop its job, it stays busy until it reports that it stopped"""
+        worker.cancel_deadline = time.monotonic() + CANCEL_TIMEOUT
+
+        try:
+            worker.connection.send(("cancel", None))
+        except OSError:
+            self._retire(worker)
+
+    def _retire(self, worker: _Worker) -> None:
+        """Terminate a worker and start another one in its slot"""
+        worker.process.terminate()
+        worker.retired = True
+
+        if not self._closed.is_set():
+            self._start_worker(worker.slot)
+            self._start_pending_jobs()
+
+    def _monitor_jobs(self) -> None:
+        while not self._closed.is_set():
+            with self._lock:
+                connections = list(self._workers)
+
+            for connection in wait(connections, timeout=MONITOR_INTERVAL):
+                assert isinstance(connection, Connection)
+                self._receive_report(connection)
+
+            with self._lock:
+                now = time.monotonic()
+                for worker in list(self._workers.values()):
+                    if (
+                        not worker.retired
+                        and worker.cancel_deadline is not None
+                        and worker.cancel_deadline < now
+                    ):
+                        self._retire(worker)
+
+        for connection, worker in self._workers.items():
+            connection.close()
+            worker.process.join()
+
+    def _receive_report(self, connection: Connection) -> None:
+        try:
+            kind, payload = connection.recv()
+        # A terminated process can leave a partial report too
+        except (EOFError, OSError, ValueError, TypeError, AttributeError):
+            kind, payload = "exited", None
+
+        with self._lock:
+            worker = self._workers[connection]
+            job = self._jobs.get(worker.job_id) if worker.job_id is not None else None
+
+            if kind == "exited":
+                del self._workers[connection]
+                connection.close()
+                worker.process.join()
+
+                if not worker.retired:
+                    worker.retired = True
+                    if not self._closed.is_set():
+                        self._start_worker(worker.slot)
+            elif worker.cancel_deadline is not None:
+                # Reports of a cancelled job are discarded until the worker stops it
+                if kind == "cancelled":
+                    worker.job_id = None
+                    worker.cancel_deadline = None
+                    self._start_pending_jobs()
+                return
+
+            # Reports of removed jobs are discarded
+            if job is None or job.status != JobStatus.RUNNING:
+                self._start_pending_jobs()
+                return
+
+            if kind == "progress":
+                job.progress = payload
+                job.best_configuration = payload["best_configuration"]
+                self._touch(job)
+                return
+
+            worker.job_id = None
+
+            if kind == "done":
+                job.progress, job.result = payload
+                job.best_configuration = job.result["best_configuration"]
+                self._finish(job, JobStatus.DONE)
+            elif kind == "failed":
+                logger.error("Job %s failed\n%s", job.id, payload)
+                job.error = payload.strip().splitlines()[-1]
+                self._finish(job, JobStatus.FAILED)
+            elif kind == "invalid":
+                job.error = payload
+                self._finish(job, JobStatus.INVALID)
+            else:
+                job.error = f"Job process exited with code {worker.process.exitcode}"
+                self._finish(job, JobStatus.FAILED)
+
+            self._start_pending_jobs()
+
+    def _touch(self, job: Job) -> None:
+        job.version += 1
+        self._updated.notify_all()
+
+    def _finish(self, job: Job, status: JobStatus) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        self._touch(job)
+
+        finished_job_ids = [
+            finished_job_id
+            for finished_job_id, finished_job in self._jobs.items()
+            if finished_job.status.finished()
+        ]
+        for finished_job_id in finished_job_ids[:-MAX_FINISHED_JOBS]:
+            del self._jobs[finished_job_id]
+
+
+class JobCancelledError(Exception):
+    pass
+
+
+def _run_worker(
+    connection: Connection,
+    model_cache_dir: str | None,
+    evaluation_cache_path: str | None,
+) -> None:
+    # The search modules are imported before the first job
+    import yaml
+
+    from main import process
+    from model_cache import CompiledModelCache
+
+    if evaluation_cache_path is not None:
+        os.makedirs(os.path.dirname(evaluation_cache_path), exist_ok=True)
+
+    compiled_models = CompiledModelCache(WORKER_MODELS, model_cache_dir)
+
+    while True:
+        try:
+            command, model_text = connection.recv()
+        except EOFError:
+            return
+
+        if command == "cancel":
+            # The job had already ended when it was cancelled
+            connection.send(("cancelled", None))
+            continue
+
+        try:
+            # Compiled before the search, so the errors of the model are told apart from the errors of the search, which takes it from the cache
+            compiled_models.load(model_text)
+        except (
+            yaml.YAMLError,
+            LookupError,
+            TypeError,
+            ValueError,
+            AttributeError,
+        ) as error:
+            connection.send(
+                ("invalid", f"Invalid model, {type(error).__name__}: {error}")
+            )
+            continue
+
+        metrics: dict[str, Any] = {}
+
+        def send_metrics(event: dict[str, Any]) -> None:
+            nonlocal metrics
+            metrics = event
+
+            # The only message sent to a busy worker is the cancellation of its job
+            if connection.poll():
+                connection.recv()
+                raise JobCancelledError()
+
+            # The last event is sent with the result
+            if not event["finished"]:
+                connection.send(("progress", event))
+
+        try:
+            plant = process(
+                model_string=model_text,
+                cache_path=evaluation_cache_path,
+                compiled_models=compiled_models,
+                on_metrics=send_metrics,
+                show_plot=False,
+            )
+
+            result = {
+                "best_performance_ratio": None,
+                "best_configuration": None,
+                "plant_grid": None,
+            }
+            if plant is not None:
+                result = {
+                    "best_performance_ratio": metrics["best_performance_ratio"],
+                    "best_configuration": plant.export_config_formated(),
+                    "plant_grid": plant.grid_names(),
+                }
+
+            connection.send(("done", (metrics, result)))
+        except JobCancelledError:
+            connection.send(("cancelled", None))
+        except Exception:  # pylint: disable=broad-exception-caught
+            connection.send(("failed", traceback.format_exc()))
@@ -1,16 +1,18 @@
+import argparse
 from io import TextIOWrapper
-import sys
-import outputs
+import math
+from typing import Callable
+from evaluation_cache import DEFAULT_MAX_ENTRIES, EvaluationCache
 from graph import TreeNode
 from graph import problem as graph_problem
-from graph.process import ManufacturingProcessGraph
 from model import Vector
-from model import tools as model_tools
-from support import (
-    check_configuration_each_leave,
-    populate_next_nodes,
-)
-
+from model.plant_graph import GraphPlant
+from model.symmetry import PlantSymmetry
+from model.tools import ROOT_STATION
+from model_cache import CompiledModelCache, compile_model, load_compiled_model
+from parallel import parallel_search
+from search_metrics import MetricsEvent, MetricsProgressLine, SearchMetrics
+from support import SearchContext
 
 """The position 0, 3 is the center of the first row, and has to contain the InOut station
 
@@ -34,109 +36,280 @@ For example, intermediate storage places can be used as a buffer for the system,
 """
 
 
-def process(model_string: str = "", model_stream: TextIOWrapper | None = None):
+def process(
+    model_string: str = "",
+    model_stream: TextIOWrapper | None = None,
+    workers: int = 1,
+    split_depth: int = 2,
+    use_symmetry: bool = True,
+    use_mirror_symmetry: bool = False,
+    use_bound: bool = False,
+    use_feasibility: bool = True,
+    use_reach_tables: bool = True,
+    cache_path: str | None = None,
+    cache_size: int = DEFAULT_MAX_ENTRIES,
+    model_cache_dir: str | None = None,
+    compiled_models: CompiledModelCache | None = None,
+    on_metrics: Callable[[MetricsEvent], None] | None = None,
+    show_plot: bool = True,
+):
+    """Search the best plant configuration for a model
 
-    spec = model_tools.SystemSpecification(
-        model_string=model_string, model_stream=model_stream
-    )
-    flow_graph = ManufacturingProcessGraph(spec.model)
+    With more than one worker, the search is split in subtrees below the first split_depth placement levels and run in a process pool, see parallel.parallel_search. The result is the same as the sequential search.
+
+    If use_symmetry is set, only one configuration of each symmetry class is generated: configurations that swap interchangeable stations and, if use_mirror_symmetry is set too, configurations mirrored about the InOut column when the grid and the station models are symmetric about it. The best configuration is reported with all its equivalent variants. Mirrored configurations can get different results (see model.symmetry), so with use_mirror_symmetry the best configuration can be missed.
+
+    If use_bound is set, the search is a branch and bound that prunes the configurations whose graph_problem.PathingLowerBound is not lower than the best result found so far. The best result is the same, but the pruned configurations are not checked nor counted.
+
+    If use_feasibility is set, the partial configurations that can't lead to a valid configuration are discarded while they are generated, see graph_problem.FeasibilityChecker, so most invalid configurations are never checked.
 
-    flow_graph.generate_model_graph()
+    If use_reach_tables is set, the path lengths between each pair of station models are precomputed, see graph_problem.ReachTables, and the configurations with a routing edge out of range are rejected without building their visibility graphs.
+
+    If cache_path is given, the results of the configurations are stored in an EvaluationCache database at that path and reused in later runs of the same model. The cache keeps up to cache_size configurations.
+
+    If model_cache_dir is given, the parsed specification, the process graph and the reach tables are loaded from that directory when the model text hasn't changed since a previous run, see model_cache. If compiled_models is given, they are taken from it instead, so a long-lived process keeps them in memory between runs.
+
+    If on_metrics is given, it receives the search metrics while the configurations are checked and once more when the search ends, see search_metrics.SearchMetrics. If show_plot is not set, the best configuration is not plotted, as when the search runs in a server.
+    """
+
+    if model_stream is not None:
+        model_string = model_stream.read()
+
+    if compiled_models is not None:
+        compiled_model = compiled_models.load(model_string, use_reach_tables)
+    elif model_cache_dir is not None:
+        compiled_model = load_compiled_model(
+            model_string, model_cache_dir, use_reach_tables
+        )
+    else:
+        compiled_model = compile_model(model_string, use_reach_tables)
+    spec = compiled_model.spec
+    flow_graph = compiled_model.flow_graph
+    reach_tables = compiled_model.reach_tables
 
     flow_graph.print()
 
-    first_nodes: list[TreeNode] = []
+    first_node = TreeNode(ROOT_STATION, Vector(2, 0), None)
 
-    for conveyor_station_name in spec.model.stations.grid.conveyor.keys():
-        first_nodes.append(
-            TreeNode(
-                conveyor_station_name,
-                Vector(2, 0),
-                first_nodes[-1] if len(first_nodes) > 0 else None,
+    symmetry = (
+        PlantSymmetry.detect(spec, first_node.position, use_mirror_symmetry)
+        if use_symmetry
+        else None
+    )
+
+    if symmetry is not None:
+        if symmetry.mirror is not None:
+            print("Mirror symmetry detected")
+        for group in spec.equivalent_stations:
+            print("Interchangeable stations: " + ", ".join(group))
+        print("Only canonical configurations are generated")
+
+    cache = (
+        EvaluationCache(cache_path, spec, symmetry, cache_size)
+        if cache_path is not None
+        else None
+    )
+
+    # All the state of the search belongs to this run
+    context = SearchContext()
+
+    metrics = (
+        SearchMetrics(context, spec, on_metrics, cache=cache)
+        if on_metrics is not None
+        else None
+    )
+    progress = metrics.update if metrics is not None else None
+
+    try:
+        if workers > 1:
+            parallel_search(
+                context,
+                first_node,
+                spec,
+                workers,
+                split_depth,
+                symmetry,
+                use_bound,
+                use_feasibility,
+                use_reach_tables,
+                cache,
+                flow_graph,
+                reach_tables,
+                progress,
             )
-        )
+        else:
+            # Configurations are generated and checked one by one, the tree is never built
+            context.check_configurations(
+                context.iterate(
+                    first_node,
+                    spec.model.stations.models,
+                    spec,
+                    symmetry=symmetry,
+                    lower_bound=(
+                        graph_problem.PathingLowerBound(flow_graph, spec)
+                        if use_bound
+                        else None
+                    ),
+                    feasibility=(
+                        graph_problem.FeasibilityChecker(flow_graph, spec)
+                        if use_feasibility
+                        else None
+                    ),
+                    progress=progress,
+                ),
+                flow_graph,
+                spec,
+                cache,
+                reach_tables,
+                progress,
+            )
+    finally:
+        # Also when the search is interrupted, so the database is not left locked
+        if cache is not None:
+            cache.evict()
+            cache.close()
+
+    if metrics is not None:
+        metrics.finish()
+
+    if cache is not None:
+        print(f"Evaluation cache hits: {cache.hits}, misses: {cache.misses}")
+        print(f"Evaluation cache hit rate: {cache.hit_rate()}")
 
-    populate_next_nodes(first_nodes[-1], spec.model.stations.models, spec)
+    print(
+        f"Visibility graph cache hits: {context.visibility_graph_hits}, misses: {context.visibility_graph_misses}"
+    )
+    print(f"Visibility graph cache hit rate: {context.visibility_graph_hit_rate()}")
 
+    repository_size, repository_bytes = context.repository_size()
     print(
-        f"Size of the configs repo: {sys.getsizeof(populate_next_nodes.config_repository) / 1000 / 1000} MB"
+        f"Size of the configs repo: {repository_size} configurations, {repository_bytes / 1000 / 1000} MB"
     )
+    print(f"Configs repo hit rate: {context.hit_rate()}")
 
-    print("Evaluated nodes: " + str(populate_next_nodes.evaluated_nodes))
-    print("Configurations generated: " + str(populate_next_nodes.valid_nodes))
+    print("Evaluated nodes: " + str(context.evaluated_nodes))
+    print("Configurations generated: " + str(context.valid_nodes))
     print(
         "Discarded configurations: "
-        + str(populate_next_nodes.evaluated_nodes - populate_next_nodes.valid_nodes)
+        + str(context.evaluated_nodes - context.valid_nodes)
     )
 
-    check_configuration_each_leave(first_nodes[-1], flow_graph, spec)
+    if use_feasibility:
+        print("Infeasible configurations discarded: " + str(context.infeasible_nodes))
+
+    if use_bound:
+        print("Pruned configurations: " + str(sum(context.pruned_nodes.values())))
+        for depth, count in sorted(context.pruned_nodes.items()):
+            print(f"Pruned configurations with {depth} stations: {count}")
 
     print("Configurations checked")
 
     print(
-        "Count of valid configurations: "
-        + str(check_configuration_each_leave.count_of_valid_configurations)
+        "Count of valid configurations: " + str(context.count_of_valid_configurations)
     )
     print(
-        "Count of total configurations: "
-        + str(check_configuration_each_leave.count_of_total_configurations)
+        "Count of total configurations: " + str(context.count_of_total_configurations)
     )
     print(
         "Rate of valid configurations: "
         + str(
-            check_configuration_each_leave.count_of_valid_configurations
-            / (check_configuration_each_leave.count_of_total_configurations + 1)
+            context.count_of_valid_configurations
+            / (context.count_of_total_configurations + 1)
         )
     )
 
-    print(
-        "Count of error configurations: "
-        + str(check_configuration_each_leave.count_error_configurations)
-    )
+    print("Count of error configurations: " + str(context.count_error_configurations))
 
     # Print graph again
 
     print("Performance checked")
     print(
         "Count of checked configurations: "
-        + str(check_configuration_each_leave.count_of_checked_configurations)
+        + str(context.count_of_checked_configurations)
     )
 
-    if check_configuration_each_leave.best_performance_node:
-        plant, _ = graph_problem.create_plant_from_node_with_station_models_used(
-            check_configuration_each_leave.best_performance_node, spec
-        )
+    if context.best_performance_state:
+        plant = GraphPlant(spec)
+        plant.import_state(context.best_performance_state)
+        plant.set_ready()
+        # Used by evaluate_plant and the plot
+        plant.build_vis_graphs()
 
         plant.render()
 
-        print(
-            "Best performance ratio: "
-            + str(check_configuration_each_leave.best_performance_ratio)
-        )
-        print(
-            "Best performance node: "
-            + str(check_configuration_each_leave.best_performance_node)
-        )
+        print("Best performance ratio: " + str(context.best_performance_ratio))
+        print("Best performance configuration: " + str(plant.export_config_formated()))
+
+        if symmetry is not None:
+            # Mirrored configurations can get a different result, so only the variants with the same result are equivalent
+            for variant in symmetry.variants(context.best_performance_state)[1:]:
+                variant_plant = GraphPlant(spec)
+                variant_plant.import_state(variant)
+                variant_plant.set_ready()
+                variant_result = graph_problem.check_configuration_v2(
+                    variant_plant, flow_graph
+                )
+                if variant_result is False or not math.isclose(
+                    variant_result, context.best_performance_ratio
+                ):
+                    continue
+                print(
+                    "Equivalent configuration: "
+                    + str(variant_plant.export_config_formated())
+                )
 
     else:
         print("No valid configuration found")
+        return None
 
     print(graph_problem.evaluate_plant(plant, flow_graph))
 
-    plant_plot = plant.plot_plant_graph()
+    if show_plot:
+        plant_plot = plant.plot_plant_graph()
 
-    plant_plot[0].show()
+        plant_plot[0].show()
 
     return plant
 
 
-def export(first_node, flow_graph: ManufacturingProcessGraph):
-    outputs.export_tree_graph(first_node, "tree")
-    flow_graph.export("manufacturing_graph")
-
-
 if __name__ == "__main__":
 
-    model_file = open("./model.yaml", "r", encoding="utf8")
-
-    process(model_stream=model_file)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model", nargs="?", default="./model.yaml")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--split-depth", type=int, default=2)
+    parser.add_argument("--no-symmetry", action="store_true")
+    parser.add_argument(
+        "--mirror-symmetry",
+        action="store_true",
+        help="skip mirrored configurations too, faster but it can miss the best one",
+    )
+    parser.add_argument("--branch-and-bound", action="store_true")
+    parser.add_argument("--no-feasibility", action="store_true")
+    parser.add_argument("--no-reach-tables", action="store_true")
+    parser.add_argument("--cache", help="path of the evaluation cache database")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_ENTRIES)
+    parser.add_argument(
+        "--model-cache", help="directory of the parsed and compiled models cache"
+    )
+    parser.add_argument(
+        "--no-progress", action="store_true", help="don't show the metrics line"
+    )
+    args = parser.parse_args()
+
+    model_file = open(args.model, "r", encoding="utf8")
+
+    process(
+        model_stream=model_file,
+        workers=args.workers,
+        split_depth=args.split_depth,
+        use_symmetry=not args.no_symmetry,
+        use_mirror_symmetry=args.mirror_symmetry,
+        use_bound=args.branch_and_bound,
+        use_feasibility=not args.no_feasibility,
+        use_reach_tables=not args.no_reach_tables,
+        cache_path=args.cache,
+        cache_size=args.cache_size,
+        model_cache_dir=args.model_cache,
+        on_metrics=None if args.no_progress else MetricsProgressLine(),
+    )
@@ -24,15 +24,25 @@ class Vector(Generic[IntOrFloat]):
     """
     Representation of a position in a 2D plane. It contains the x and y coordinates of the position. It has methods to calculate the distance between two positions and the dot product between two positions.
 
-    Returns:
-        _type_: _description_
+    Vectors are immutable, so they can be shared between plants and nodes without copying them, and they are compared and hashed by their coordinates, so they can be used as dict keys.
     """
 
     # pylint: disable=missing-function-docstring
 
+    __slots__ = ("x", "y")
+
+    x: IntOrFloat
+    y: IntOrFloat
+
     def __init__(self, x: IntOrFloat, y: IntOrFloat) -> None:
-        self.x: IntOrFloat = x
-        self.y: IntOrFloat = y
+        _set_attribute(self, "x", x)
+        _set_attribute(self, "y", y)
+
+    def __setattr__(self, __name: str, __value: object) -> None:
+        raise AttributeError(f"Vector is immutable, {__name} can't be set")
+
+    def __delattr__(self, __name: str) -> None:
+        raise AttributeError(f"Vector is immutable, {__name} can't be deleted")
 
     def __str__(self) -> str:
         return f"({self.x}, {self.y})"
@@ -40,8 +50,25 @@ class Vector(Generic[IntOrFloat]):
     def __repr__(self) -> str:
         return self.__str__()
 
+    def __eq__(self, __value: object) -> bool:
+        if not isinstance(__value, Vector):
+            return NotImplemented
+        return bool(self.x == __value.x and self.y == __value.y)
+
+    def __hash__(self) -> int:
+        return hash((self.x, self.y))
+
+    def __reduce__(self):
+        return (Vector, (self.x, self.y))
+
+    def __copy__(self) -> Vector[IntOrFloat]:
+        return self
+
+    def __deepcopy__(self, _memo) -> Vector[IntOrFloat]:
+        return self
+
     def equal(self, __value: Vector[IntOrFloat]) -> bool:
-        return self.x == __value.x and self.y == __value.y
+        return self == __value
 
     def __add__(self, __value: Vector[float]) -> Vector[float]:
         return Vector(self.x + __value.x, self.y + __value.y)
@@ -55,9 +82,9 @@ class Vector(Generic[IntOrFloat]):
     def dot_product(self, __value: Vector) -> float:
         return float(self.x * __value.x + self.y * __value.y)
 
-    def set(self, x: IntOrFloat, y: IntOrFloat) -> None:
-        self.x = x
-        self.y = y
+
+# Vector.__setattr__ is disabled, the coordinates are only set by __init__
+_set_attribute = object.__setattr__
 
 
 class ModelSpecification:
@@ -129,6 +156,49 @@ class StationModel:
     def serialize(self):  # pylance: disable=missing_function_docstring
         return json.dumps(self)
 
+    def signature(self) -> tuple:
+        """Gets a hashable description of the station geometry and capabilities, without its name
+
+        Two stations with the same signature are interchangeable in a plant configuration.
+        """
+        storages = (
+            tuple(
+                sorted(
+                    (
+                        storage.position.x,
+                        storage.position.y,
+                        tuple(
+                            (
+                                storage_type.part,
+                                storage_type.add,
+                                storage_type.remove,
+                                tuple(storage_type.requires),
+                            )
+                            for storage_type in storage.type
+                        ),
+                    )
+                    for storage in self.storages
+                )
+            )
+            if self.storages is not None
+            else None
+        )
+        transports = (
+            (self.transports.range, tuple(sorted(self.transports.parts)))
+            if self.transports is not None
+            else None
+        )
+        obstacles = (
+            tuple(tuple((v.x, v.y) for v in o) for o in self.obstacles)
+            if self.obstacles is not None
+            else None
+        )
+        activities = (
+            tuple(sorted(self.activities)) if self.activities is not None else None
+        )
+
+        return (storages, transports, obstacles, activities)
+
     def get_absolute_obstacles(self, origin: Vector[float]) -> list[list[vg.Point]]:
         """Gets all obstacles of a station model with absolute positions
 
@@ -1,4 +1,4 @@
-""" Plant module
+"""Plant module
 
 
 Plant description
@@ -54,17 +54,24 @@ Grid first row is reserved for the conveyor, the stations are placed in the foll
 
 from __future__ import annotations
 
+from array import array
 import copy
 import itertools
 from typing import Any, Mapping, Optional, overload
 import re
 import prettytable
 from model import StationModel, StationNameType, Vector
+from model.plant_state import (
+    UNPLACED_CELL,
+    UNPLACED_POSITION,
+    GridBitboard,
+    PlantState,
+)
 from model.tools import SystemSpecification
 
-
 PlantConfigType = list[tuple[Vector[int] | int, StationNameType]]
 PlantConfigFormatedType = list[tuple[str, StationNameType]]
+PlantConfigKeyType = bytes
 
 
 class BasePlant(object):
@@ -80,6 +87,14 @@ class BasePlant(object):
         self._system_spec = system_spec
         self._grid_params = system_spec.model.stations.grid
         self._station_models = system_spec.model.stations.models
+        self._station_names: list[StationNameType] = list(self._station_models.keys())
+        self._station_indexes: dict[StationNameType, int] = {
+            station_name: index
+            for index, station_name in enumerate(self._station_names)
+        }
+        self._bitboard = GridBitboard.for_size(
+            self._grid_params.size.x, self._grid_params.size.y
+        )
 
         # To export and import plant configurations
         self.__config: list[tuple[Vector[int] | int, StationNameType]] = []
@@ -100,11 +115,16 @@ class BasePlant(object):
         ]
 
         self._station_locations: dict[StationNameType, Vector[int] | int] = {
-            station_name: Vector(-1, -1)
+            station_name: UNPLACED_POSITION
             for station_name in self._system_spec.model.stations.models.keys()
         }
+        # Packed state, kept in sync with the grid on every placement
+        self._occupancy: int = 0
+        self._frontier: int = 0
+        self._station_cells = array("H", [UNPLACED_CELL]) * len(self._station_names)
+        self._placement_stack: list[StationNameType] = []
         self._not_ready = True
-d
+
     def set_ready(self):
         self._not_ready = False
 
@@ -140,7 +160,7 @@ d
 
         assert (
             isinstance(self._station_locations[name], Vector)
-            and self._station_locations[name] == -1
+            and self._station_locations[name].x == -1  # type: ignore
         ), f"Station {name} is already placed"
 
         if isinstance(position, int):
@@ -154,7 +174,8 @@ d
                     f"Storage buffer {position} is not empty, can't move station {name}"
                 )
 
-            self._station_locations[name] = copy.deepcopy(position)
+            self._station_locations[name] = position
+            self._mark_location(name, position)
 
         if isinstance(position, Vector):
 
@@ -165,9 +186,55 @@ d
 
             self._grid[position.y][position.x] = self._station_models[name]
             self._station_locations[name] = position
+            self._mark_location(name, position)
+
+    def push_station(self, name: StationNameType, position: Vector[int] | int):
+        """Place a station so that it can be undone later with pop_station
+
+        Used by the search to build the configurations incrementally on a single plant instead of creating a new plant for each configuration.
+        """
+        self.set_station_location_by_name(name, position)
+        self._placement_stack.append(name)
+
+    def pop_station(self) -> StationNameType:
+        """Undo the last placement done with push_station"""
+        name = self._placement_stack.pop()
+        position = self._station_locations[name]
+
+        if isinstance(position, Vector):
+            self._grid[position.y][position.x] = None
+
+        self._station_locations[name] = UNPLACED_POSITION
+        self._unmark_location(name, position)
+
+        return name
+
+    def _mark_location(self, name: StationNameType, position: Vector[int] | int):
+        if isinstance(position, int):
+            self._station_cells[self._station_indexes[name]] = (
+                self._bitboard.cells_count + position
+            )
+            return
+
+        cell = self._bitboard.index(position.x, position.y)
+        self._station_cells[self._station_indexes[name]] = cell
+        self._occupancy |= 1 << cell
+        self._frontier = (
+            self._frontier | self._bitboard.neighbours_mask(1 << cell)
+        ) & ~self._occupancy
+
+    def _unmark_location(self, name: StationNameType, position: Vector[int] | int):
+        self._station_cells[self._station_indexes[name]] = UNPLACED_CELL
+
+        if isinstance(position, int):
+            return
+
+        self._occupancy &= ~(1 << self._bitboard.index(position.x, position.y))
+        # A cell could still be next to other stations, so the frontier is computed again from the occupancy
+        self._frontier = self._bitboard.neighbours_mask(self._occupancy)
 
     def get_station_location_by_name(self, name: StationNameType):
-        return copy.copy(self._station_locations[name])
+        return self._station_locations[name]
 
     def get_station_by_coord(self, x: int, y: int) -> StationModel:
         station = self._grid[y][x]
@@ -175,28 +242,21 @@ d
         return station
 
     def get_adjacent_positions(self) -> list[Vector[int]]:
+        """Get the empty station positions next to any placed station, ordered by column and then by row"""
 
-        available_positions: list[Vector] = []
+        return [
+            self._bitboard.position(index)
+            for index in self._bitboard.iter_indexes(
+                self._frontier & self._bitboard.stations_mask
+            )
+        ]
 
-        for x, y in itertools.product(
-            range(self._grid_params.size.x), range(1, self._grid_params.size.y)
-        ):
-            if self._grid[y][x] is None:
-                if (
-                    (y > 1 and self._grid[y - 1][x] is not None)
-                    or (x > 0 and self._grid[y][x - 1] is not None)
-                    or (
-                        x < self._grid_params.size.x - 1
-                        and self._grid[y][x + 1] is not None
-                    )
-                    or (
-                        y < self._grid_params.size.x - 1
-                        and self._grid[y + 1][x] is not None
-                    )
-                ):
-                    available_positions.append(Vector(x, y))
-
-        return available_positions
+    def occupancy(self) -> int:
+        return self._occupancy
+
+    def station_cells(self) -> array:
+        """Get the live packed array of station cells, see PlantState. It must not be modified."""
+        return self._station_cells
 
     def get_stations_with_transport_positions(self) -> list[Vector]:
 
@@ -205,7 +265,7 @@ d
         for station in self._station_models.values():
             station_location = self._station_locations[station.name]
             if station.transports is not None and isinstance(station_location, Vector):
-                transport_vectors.append(copy.deepcopy(station_location))
+                transport_vectors.append(station_location)
 
         if len(transport_vectors) > 0:
             return transport_vectors
@@ -273,6 +333,32 @@ d
 
         return hash_set
 
+    def get_config_key(self) -> PlantConfigKeyType:
+        """Get a hashable key of the plant configuration
+
+        Same content as get_config_set, packed as the station cells array of the plant state (two bytes per station), so it can be stored in a set or used as a dict key.
+        """
+
+        return self.export_state().cells
+
+    def export_state(self) -> PlantState:
+        return PlantState(self._occupancy, self._station_cells.tobytes())
+
+    def import_state(self, state: PlantState):
+        self.reset()
+
+        for station_index, cell in enumerate(state.station_cells()):
+            if cell == UNPLACED_CELL:
+                continue
+            self.set_station_location_by_name(
+                self._station_names[station_index],
+                (
+                    self._bitboard.position(cell)
+                    if cell < self._bitboard.cells_count
+                    else cell - self._bitboard.cells_count
+                ),
+            )
+
     def export_config(self):
         self._create_config_from_plant()
         return self.__config
@@ -338,6 +424,13 @@ d
 
         return table
 
+    def grid_names(self) -> list[list[StationNameType | None]]:
+        """Get the names of the stations in the grid by row, None for the empty cells"""
+        return [
+            [station.name if station is not None else None for station in row]
+            for row in self._grid
+        ]
+
 
 class GridIterator:
     def __init__(self, grid: list[list[Any]]) -> None:
@@ -1,14 +1,27 @@
+from collections import OrderedDict
 import copy
 from dataclasses import dataclass
-import itertools
+from heapq import heappop, heappush
 from math import atan2, cos, sin, sqrt
+import threading
 from typing import Optional
 from model import StationModel, StationNameType, Vector
 from model.plant import BasePlant, PlantConfigType
 from model.tools import SystemSpecification
+import numpy as np
 import pyvisgraph as vg
+from pyvisgraph.visible_vertices import edge_distance, visible_vertices
 import shapely
 
+# Minimum distance between a segment and the obstacles to take it as a straight path
+CLEARANCE = 1e-9
+
+# Precision of the merged obstacles of the transport visibility graphs
+OBSTACLES_GRID_SIZE = 0.1
+
+# Transport visibility graphs kept by visibility_graph_cache
+VISIBILITY_GRAPH_CACHE_SIZE = 4096
+
 
 class GraphPlant(BasePlant):
     """
@@ -20,8 +33,14 @@ class GraphPlant(BasePlant):
 
         super().__init__(system_spec)
 
+        self._spec_hash = system_spec.content_hash()
         self._poligons: PlantPoligonsPoints = PlantPoligonsPoints([], {})
         self._vis_graphs: dict[StationNameType, vg.VisGraph] = {}
+        # Index of the merged obstacles of each transport visibility graph
+        self._obstacle_trees: dict[StationNameType, shapely.STRtree] = {}
+        # Lookups of the transport visibility graphs in visibility_graph_cache made by this plant
+        self.visibility_graph_hits = 0
+        self.visibility_graph_misses = 0
 
     def shortest_path(
         self, station_name: StationNameType, point1: vg.Point, point2: vg.Point
@@ -34,41 +53,34 @@ class GraphPlant(BasePlant):
 
         assert not self._not_ready
 
-        # Compute the poligons that are going to be used to build the visibility graph
-        for x, y in itertools.product(
-            range(self._grid_params.size.x), range(self._grid_params.size.y)
-        ):
+        # The plant can be reused for several configurations, so the previous graphs are discarded
+        self._poligons = PlantPoligonsPoints([], {})
+        self._vis_graphs = {}
+        self._obstacle_trees = {}
 
-            station = self._grid[y][x]
+        # Compute the poligons that are going to be used to build the visibility graph, only occupied cells are visited
+        for index in self._bitboard.iter_indexes(self._occupancy):
+            x, y = divmod(index, self._bitboard.size_y)
+
+            station = self.get_station_by_coord(x, y)
 
-            if station is None:
-                continue
             if station.obstacles is None:
                 continue
+
+            # The precomputed polygons are shared by all the plants, they are not modified
+            obstacles = self._system_spec.absolute_obstacles[station.name][index]
+
             if station.transports is None:
-                self._poligons.normal.extend(
-                    station.get_absolute_obstacles(
-                        Vector(
-                            x * self._grid_params.measures.x,
-                            y * self._grid_params.measures.y,
-                        )
-                    )
-                )
+                self._poligons.normal.extend(obstacles)
             else:
-                self._poligons.robot[station.name] = station.get_absolute_obstacles(
-                    Vector(
-                        x * self._grid_params.measures.x,
-                        y * self._grid_params.measures.y,
-                    )
-                )
+                self._poligons.robot[station.name] = obstacles
 
         # Compute the visibility graph for each transport station
-        for x, y in itertools.product(
-            range(self._grid_params.size.x), range(self._grid_params.size.y)
-        ):
-            station = self._grid[y][x]
-            if station is None:
-                continue
+        for index in self._bitboard.iter_indexes(self._occupancy):
+            x, y = divmod(index, self._bitboard.size_y)
+
+            station = self.get_station_by_coord(x, y)
+
             if station.transports is None:
                 continue
 
@@ -80,19 +92,91 @@ class GraphPlant(BasePlant):
                     + y * self._grid_params.measures.y,
                 ),
                 station.name,
+                self._bitboard.position(index),
             )
 
     def _build_transport_visibility_graph(
-        self, station_position: Vector[float], station_name: str
+        self,
+        station_position: Vector[float],
+        station_name: str,
+        station_cell: Vector[int],
     ):
+        """Build the visibility graph of a transport station and its obstacles index
+
+        The graph only depends on the transport station and the other stations with obstacles at their offsets from it, so it is computed around the transport station, stored in visibility_graph_cache and translated to the station position. The graph is moved by an offset in the obstacles grid, so the translated coordinates are the same ones that computing it in place would give.
+        """
+        offset = Vector(
+            snap_to_grid(station_position.x), snap_to_grid(station_position.y)
+        )
+        relative_position = Vector(
+            station_position.x - offset.x, station_position.y - offset.y
+        )
+
+        key = (
+            self._spec_hash,
+            station_name,
+            round(relative_position.x, 9),
+            round(relative_position.y, 9),
+            self._obstacles_pattern(station_name, station_cell),
+        )
+
+        relative_graph = visibility_graph_cache.get(key)
+        if relative_graph is not None:
+            self.visibility_graph_hits += 1
+        else:
+            self.visibility_graph_misses += 1
+            relative_graph = self._compute_relative_visibility_graph(
+                offset, relative_position, station_name
+            )
+            visibility_graph_cache.put(key, relative_graph)
+
+        self._vis_graphs[station_name] = translate_vis_graph(
+            relative_graph.vis_graph, offset.x, offset.y
+        )
+        scale = 1 / OBSTACLES_GRID_SIZE
+        self._obstacle_trees[station_name] = shapely.STRtree(
+            shapely.transform(
+                relative_graph.obstacles,
+                lambda coordinates: np.round(
+                    (coordinates + (offset.x, offset.y)) * scale
+                )
+                / scale,
+            )
+        )
+
+    def _obstacles_pattern(
+        self, station_name: str, station_cell: Vector[int]
+    ) -> tuple[tuple[StationNameType, int, int], ...]:
+        """Get the other stations with obstacles in the grid, with their offsets from a station cell"""
+        pattern: list[tuple[StationNameType, int, int]] = []
 
-        self._vis_graphs[station_name] = vg.VisGraph()
+        for index in self._bitboard.iter_indexes(self._occupancy):
+            x, y = divmod(index, self._bitboard.size_y)
+
+            station = self.get_station_by_coord(x, y)
+
+            if station.obstacles is None or station.name == station_name:
+                continue
 
-        # List of all other poligons that are not from the current transport station
+            pattern.append((station.name, x - station_cell.x, y - station_cell.y))
+
+        return tuple(pattern)
+
+    def _compute_relative_visibility_graph(
+        self,
+        offset: Vector[float],
+        station_position: Vector[float],
+        station_name: str,
+    ) -> "RelativeVisibilityGraph":
+
+        vis_graph = vg.VisGraph()
+
+        # List of all other poligons that are not from the current transport station, moved by -offset
         all_other_poligons: list[list[vg.Point]] = [
-            p for p in self._poligons.normal
+            [vg.Point(point.x - offset.x, point.y - offset.y) for point in p]
+            for p in self._poligons.normal
         ] + [
-            p
+            [vg.Point(point.x - offset.x, point.y - offset.y) for point in p]
             for poligon_station_name, poligons in self._poligons.robot.items()
             for p in poligons
             if poligon_station_name != station_name
@@ -159,7 +243,9 @@ class GraphPlant(BasePlant):
             for poligon in final_poligons
         ]
 
-        shapely_poligons_union = shapely.union_all(shapely_poligons, grid_size=0.1)
+        shapely_poligons_union = shapely.union_all(
+            shapely_poligons, grid_size=OBSTACLES_GRID_SIZE
+        )
 
         # Once the poligons are merged, we have to convert them back to the format that the visibility graph can use
         # If the merge process returns only one poligon we will convert it to a multipoligon (just and array of poligons), to simplify the conversion later.
@@ -176,7 +262,16 @@ class GraphPlant(BasePlant):
         for poligon in new_poligons:
             poligon.pop()
 
-        self._vis_graphs[station_name].build(new_poligons, workers=1, status=False)
+        vis_graph.build(new_poligons, workers=1, status=False)
+
+        # The visibility graph only uses the exterior of the poligons, so the holes are filled
+        return RelativeVisibilityGraph(
+            vis_graph,
+            [
+                shapely.Polygon(shapely_poligon.exterior)
+                for shapely_poligon in shapely_poligons_union.geoms
+            ],
+        )
 
     def get_path_between_two_points_with_transport(
         self, point1: Vector[float], point2: Vector[float], transport_name: str
@@ -186,6 +281,208 @@ class GraphPlant(BasePlant):
             vg.Point(point1.x, point1.y), vg.Point(point2.x, point2.y)
         )
 
+    def get_distance_between_two_points_with_transport(
+        self, point1: Vector[float], point2: Vector[float], transport_name: str
+    ) -> float:
+        """Get the length of the shortest path between two points in the visibility graph of a transport station
+
+        If the straight segment between the points doesn't touch any obstacle, it is the shortest path and the visibility graph is not searched.
+        """
+        if self.is_segment_clear(
+            point1.x, point1.y, point2.x, point2.y, transport_name
+        ):
+            return sqrt((point1.x - point2.x) ** 2 + (point1.y - point2.y) ** 2)
+
+        return path_distance(
+            self.get_path_between_two_points_with_transport(
+                point1, point2, transport_name
+            )
+        )
+
+    def is_segment_clear(
+        self, x1: float, y1: float, x2: float, y2: float, transport_name: str
+    ) -> bool:
+        """Check if a segment doesn't touch any obstacle of the visibility graph of a transport station
+
+        Segments closer than CLEARANCE to an obstacle are not clear, pyvisgraph rounds the coordinates to check collinearity so it could consider that they touch it.
+        """
+        return (
+            len(
+                self._obstacle_trees[transport_name].query(
+                    shapely.LineString([(x1, y1), (x2, y2)]),
+                    predicate="dwithin",
+                    distance=CLEARANCE,
+                )
+            )
+            == 0
+        )
+
+    def are_segments_clear(
+        self, start: Vector[float], ends: np.ndarray, transport_name: str
+    ) -> np.ndarray:
+        """Check is_segment_clear for the segments from a point to each point of a (n, 2) array, with a single query"""
+        segments = np.empty((len(ends), 2, 2))
+        segments[:, 0] = (start.x, start.y)
+        segments[:, 1] = ends
+
+        clear = np.ones(len(ends), dtype=bool)
+        blocked_segments, _ = self._obstacle_trees[transport_name].query(
+            shapely.linestrings(segments), predicate="dwithin", distance=CLEARANCE
+        )
+        clear[blocked_segments] = False
+
+        return clear
+
+    def is_point_in_obstacles(self, point: Vector[float], transport_name: str) -> bool:
+        """Check if a point is inside any obstacle of the visibility graph of a transport station"""
+        return (
+            len(
+                self._obstacle_trees[transport_name].query(
+                    shapely.Point(point.x, point.y), predicate="within"
+                )
+            )
+            > 0
+        )
+
+    def distance_matrix_with_transport(
+        self, points: list[vg.Point], transport_name: str
+    ) -> np.ndarray:
+        """Get the shortest path distance between every pair of points in the visibility graph of a transport station
+
+        get_path_between_two_points_with_transport finds the visible vertices of both points on every call. Here the pairs of points whose straight segment is clear (see is_segment_clear) get the straight distance, then the visibility of each point of the other pairs is found once, with all the points as candidates so the direct paths between them are found in the same sweep, and a Dijkstra search from each of these points gets its distance to all the others. As with shortest_path, paths only go through the vertices of the visibility graph, never through other points of the list. The points must be different.
+
+        Returns:
+            np.ndarray: distance from each point (rows) to each point (columns), inf if there is no path
+        """
+        vis_graph = self._vis_graphs[transport_name]
+
+        x = np.array([point.x for point in points])
+        y = np.array([point.y for point in points])
+        distances: np.ndarray = np.sqrt(
+            (x[:, np.newaxis] - x[np.newaxis, :]) ** 2
+            + (y[:, np.newaxis] - y[np.newaxis, :]) ** 2
+        )
+
+        # Pairs of points whose straight segment touches an obstacle
+        pairs = [
+            (origin_index, destiny_index)
+            for origin_index in range(len(points))
+            for destiny_index in range(origin_index + 1, len(points))
+        ]
+        blocked = np.zeros((len(points), len(points)), dtype=bool)
+        if pairs:
+            blocked_segments = self._obstacle_trees[transport_name].query(
+                [
+                    shapely.LineString(
+                        [
+                            (x[origin_index], y[origin_index]),
+                            (x[destiny_index], y[destiny_index]),
+                        ]
+                    )
+                    for origin_index, destiny_index in pairs
+                ],
+                predicate="dwithin",
+                distance=CLEARANCE,
+            )[0]
+            for segment_index in blocked_segments:
+                origin_index, destiny_index = pairs[segment_index]
+                blocked[origin_index, destiny_index] = True
+                blocked[destiny_index, origin_index] = True
+
+        blocked_points = [index for index in range(len(points)) if blocked[index].any()]
+        if not blocked_points:
+            return distances
+
+        distances[blocked] = np.inf
+
+        # Obstacle graph with the points added as vertices without edges, the visibility graph itself is not modified
+        obstacles_graph = vg.Graph([])
+        obstacles_graph.graph = copy.copy(vis_graph.graph.graph)
+        obstacles_graph.edges = vis_graph.graph.edges
+        obstacles_graph.polygons = vis_graph.graph.polygons
+        for point in points:
+            if point not in obstacles_graph.graph:
+                obstacles_graph.graph[point] = set()
+
+        point_indexes = {point: index for index, point in enumerate(points)}
+
+        # Edges from each point to the visible vertices and points, and from each vertex to the points that see it
+        point_edges: list[list[vg.Point]] = [[] for _ in points]
+        vertex_edges: dict[vg.Point, list[vg.Point]] = {}
+        unreachable: set[int] = set()
+
+        for index in blocked_points:
+            point = points[index]
+            try:
+                # Points are swept apart from the vertices, so they don't change the visibility of collinear vertices
+                visible_vertices_of_point = visible_vertices(point, vis_graph.graph)
+                visible_points = [
+                    other
+                    for other in visible_vertices(point, obstacles_graph)
+                    if other in point_indexes
+                ]
+            except (KeyError, UnboundLocalError):
+                # Degenerate geometry, as in get_path_between_two_points_with_transport
+                unreachable.add(index)
+                continue
+
+            point_edges[index].extend(visible_vertices_of_point)
+            for vertex in visible_vertices_of_point:
+                vertex_edges.setdefault(vertex, []).append(point)
+
+            # Two points are connected if any of them sees the other one, as in shortest_path
+            for other in visible_points:
+                point_edges[index].append(other)
+                point_edges[point_indexes[other]].append(point)
+
+        for index in blocked_points:
+            origin = points[index]
+            if index in unreachable:
+                continue
+
+            found: dict[vg.Point, float] = {}
+            queue: list[tuple[float, int, vg.Point]] = [(0.0, 0, origin)]
+            pushed = 1
+
+            while queue:
+                distance, _, point = heappop(queue)
+
+                if point in found:
+                    continue
+                found[point] = distance
+
+                if point in point_indexes and point != origin:
+                    if blocked[index, point_indexes[point]]:
+                        distances[index, point_indexes[point]] = distance
+                    # Other points end the paths, unless they are also vertices of the visibility graph
+                    if point not in vis_graph.visgraph:
+                        continue
+
+                neighbours = [
+                    edge.get_adjacent(point) for edge in vis_graph.visgraph[point]
+                ]
+                neighbours.extend(vertex_edges.get(point, ()))
+                if point == origin:
+                    neighbours.extend(point_edges[index])
+
+                for neighbour in neighbours:
+                    if neighbour not in found:
+                        heappush(
+                            queue,
+                            (
+                                distance + edge_distance(point, neighbour),
+                                pushed,
+                                neighbour,
+                            ),
+                        )
+                        pushed += 1
+
+        for index in unreachable:
+            distances[index, blocked[index]] = np.inf
+            distances[blocked[:, index], index] = np.inf
+
+        return distances
+
     def plot_plant_graph(self):
         import matplotlib.pyplot as plt
         import matplotlib.axes
@@ -247,7 +544,9 @@ class GraphPlant(BasePlant):
 
             # Plot a point in axes representing the transport station position
             # Get transport station position
-            transport_station_position = self.search_by_name(transport_station_name)
+            transport_station_position = self.get_station_location_by_name(
+                transport_station_name
+            )
 
             axes.plot(
                 self._grid_params.half_measures.x
@@ -274,6 +573,91 @@ class GraphPlant(BasePlant):
         return fig, axes_dict, vis_axes
 
 
+@dataclass
+class RelativeVisibilityGraph:
+    """Visibility graph of a transport station and its merged obstacles, moved by an offset in the obstacles grid"""
+
+    vis_graph: vg.VisGraph
+    obstacles: list[shapely.Polygon]
+
+
+class VisibilityGraphCache:
+    """LRU cache of relative transport visibility graphs
+
+    The entries only depend on the obstacles, so the cache is shared by the searches running in the threads of a process and it is locked. It keeps no counters, each plant counts its own lookups so concurrent searches don't mix their hit rates.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, RelativeVisibilityGraph] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[RelativeVisibilityGraph]:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: RelativeVisibilityGraph) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by all the plants of the process
+visibility_graph_cache = VisibilityGraphCache(VISIBILITY_GRAPH_CACHE_SIZE)
+
+
+def snap_to_grid(value: float) -> float:
+    """Round a coordinate to the obstacles grid, as shapely does"""
+    scale = 1 / OBSTACLES_GRID_SIZE
+    return round(value * scale) / scale
+
+
+def translate_vis_graph(vis_graph: vg.VisGraph, x: float, y: float) -> vg.VisGraph:
+    """Get a copy of a built visibility graph moved by (x, y), the vertices are snapped to the obstacles grid"""
+    moved_points: dict[vg.Point, vg.Point] = {}
+
+    def moved(point: vg.Point) -> vg.Point:
+        moved_point = moved_points.get(point)
+        if moved_point is None:
+            moved_point = vg.Point(
+                snap_to_grid(point.x + x),
+                snap_to_grid(point.y + y),
+                point.polygon_id,
+            )
+            moved_points[point] = moved_point
+        return moved_point
+
+    def moved_edge(edge: vg.Edge) -> vg.Edge:
+        return vg.Edge(moved(edge.p1), moved(edge.p2))
+
+    translated = vg.VisGraph()
+
+    translated.graph = vg.Graph([])
+    for edge in vis_graph.graph.edges:
+        translated.graph.add_edge(moved_edge(edge))
+    for polygon_id, edges in vis_graph.graph.polygons.items():
+        translated.graph.polygons[polygon_id] = {moved_edge(edge) for edge in edges}
+
+    translated.visgraph = vg.Graph([])
+    for edge in vis_graph.visgraph.edges:
+        translated.visgraph.add_edge(moved_edge(edge))
+
+    return translated
+
+
 @dataclass
 class PlantPoligonsPoints:
     normal: list[list[vg.Point]]
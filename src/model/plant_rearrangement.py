@@ -63,6 +63,9 @@ class RearrangmentPlant(BasePlant):
         else:
             self._grid[previous_position.y][previous_position.x] = None
 
+        self._unmark_location(station_name, previous_position)
+        self._mark_location(station_name, destiny)
+
         return previous_position
 
     def store(self, station_name: StationNameType) -> int:
@@ -78,6 +81,7 @@ class RearrangmentPlant(BasePlant):
             )
 
         self._grid[actual_position.y][actual_position.x] = None
+        self._unmark_location(station_name, actual_position)
 
         if self.is_storage_buffer_full():
             raise UnsolvableError(f"Storage buffer is full, can't store {station_name}")
@@ -85,6 +89,7 @@ class RearrangmentPlant(BasePlant):
         self.storage_buffer[self.storage_buffer_cursor] = station_name
 
         self._station_locations[station_name] = self.storage_buffer_cursor
+        self._mark_location(station_name, self.storage_buffer_cursor)
 
         result = self.storage_buffer_cursor
 
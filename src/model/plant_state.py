@@ -0,0 +1,124 @@
+""" Compact plant state
+
+Bitboard helpers to store and query a plant configuration with integers instead of nested lists of station models.
+
+Cells are indexed column by column (index = x * size.y + y), so iterating the bits of a mask in ascending order visits the positions in the same order as itertools.product(range(size.x), range(size.y)).
+
+    ┌────► x
+    │ 0  4  8
+    │ 1  5  9
+    ▼ 2  6  10
+    y 3  7  11
+
+"""
+
+from __future__ import annotations
+
+from array import array
+from functools import lru_cache
+from typing import Iterator
+
+from model import Vector
+
+# Value stored in PlantState.cells for stations that are not placed yet
+UNPLACED_CELL = 0xFFFF
+
+# Location of the stations that are not placed yet, shared by all plants
+UNPLACED_POSITION: Vector[int] = Vector(-1, -1)
+
+
+class GridBitboard:
+    """Precomputed masks of a grid size, shared by all plants with the same grid"""
+
+    def __init__(self, size_x: int, size_y: int) -> None:
+        self.size_x = size_x
+        self.size_y = size_y
+        self.cells_count = size_x * size_y
+
+        if self.cells_count >= UNPLACED_CELL:
+            raise ValueError(f"Grid {size_x}x{size_y} is too big to be packed")
+
+        self.full_mask = (1 << self.cells_count) - 1
+
+        first_row_mask = 0
+        for x in range(size_x):
+            first_row_mask |= 1 << (x * size_y)
+
+        self.first_row_mask = first_row_mask
+        self.last_row_mask = first_row_mask << (size_y - 1)
+
+        # The first row is reserved for the conveyor, stations are placed in the following rows
+        self.stations_mask = self.full_mask & ~first_row_mask
+
+        # Vectors are immutable, so the position of each cell is created once
+        self._positions = tuple(
+            Vector(index // size_y, index % size_y) for index in range(self.cells_count)
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def for_size(size_x: int, size_y: int) -> GridBitboard:
+        return GridBitboard(size_x, size_y)
+
+    def index(self, x: int, y: int) -> int:
+        return x * self.size_y + y
+
+    def position(self, index: int) -> Vector[int]:
+        return self._positions[index]
+
+    def neighbours_mask(self, occupancy: int) -> int:
+        """Get the cells that share a side with any cell of the occupancy mask, excluding the occupied ones"""
+        return (
+            ((occupancy << 1) & ~self.first_row_mask)
+            | ((occupancy >> 1) & ~self.last_row_mask)
+            | (occupancy << self.size_y)
+            | (occupancy >> self.size_y)
+        ) & (self.full_mask & ~occupancy)
+
+    def adjacent_mask(self, occupancy: int) -> int:
+        """Get the free station cells that are next to an occupied cell"""
+        return self.neighbours_mask(occupancy) & self.stations_mask
+
+    @staticmethod
+    def iter_indexes(mask: int) -> Iterator[int]:
+        while mask:
+            lowest = mask & -mask
+            yield lowest.bit_length() - 1
+            mask ^= lowest
+
+
+class PlantState:
+    """Compact representation of a plant configuration
+
+    It contains the occupancy mask of the grid and an array of unsigned shorts mapping each station index (order of the spec models) to its cell. Stations in the storage buffer are stored as cells_count + buffer position, stations not placed as UNPLACED_CELL. Two states are equal if they place the same stations in the same cells.
+    """
+
+    __slots__ = ("occupancy", "cells")
+
+    def __init__(self, occupancy: int, cells: bytes) -> None:
+        self.occupancy = occupancy
+        self.cells = cells
+
+    def station_cells(self) -> array:
+        cells = array("H")
+        cells.frombytes(self.cells)
+        return cells
+
+    def placements(self) -> list[tuple[int, int]]:
+        """Get the (station index, cell) pairs of the placed stations"""
+        return [
+            (station_index, cell)
+            for station_index, cell in enumerate(self.station_cells())
+            if cell != UNPLACED_CELL
+        ]
+
+    def __eq__(self, __other: object) -> bool:
+        if not isinstance(__other, PlantState):
+            return NotImplemented
+        return self.cells == __other.cells
+
+    def __hash__(self) -> int:
+        return hash(self.cells)
+
+    def __repr__(self) -> str:
+        return f"PlantState({bin(self.occupancy)}, {list(self.station_cells())})"
@@ -0,0 +1,255 @@
+""" Symmetry module
+
+Configurations that only swap the cells of interchangeable stations (same geometry and capabilities, like two identical robots) have the same path costs, so only one configuration of each class has to be generated and evaluated.
+
+Configurations that mirror each other about the column of the root station would have the same path costs too when the grid and every station model are symmetric about that column, but the evaluation is not exactly mirror invariant: the obstacles behind the visible vertices of the transport visibility graphs are built following the order of the polygon vertices, so a configuration and its mirror can get different results. The mirror symmetry is only used when it is requested, as a faster search that can miss the best configuration.
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections import Counter
+from itertools import permutations, product
+from typing import Optional
+
+from model import StationModel, Vector
+from model.plant_state import UNPLACED_CELL, GridBitboard, PlantState
+from model.tools import SystemSpecification
+
+# Decimals used to compare mirrored coordinates
+COORDINATES_PRECISION = 9
+
+
+class MirrorSymmetry:
+    """Mirror symmetry about the vertical axis of a grid column
+
+    Mirrored configurations are not guaranteed to get the same result, see the module documentation.
+    """
+
+    def __init__(self, bitboard: GridBitboard) -> None:
+        self._bitboard = bitboard
+
+        # Mirrored cell of each cell, buffer positions and unplaced stations are not mirrored
+        self._cell_map = [
+            bitboard.index(bitboard.size_x - 1 - x, y)
+            for x in range(bitboard.size_x)
+            for y in range(bitboard.size_y)
+        ]
+
+    @staticmethod
+    def detect(
+        spec: SystemSpecification, root_position: Vector[int]
+    ) -> Optional[MirrorSymmetry]:
+        """Get the mirror symmetry of a spec if the grid and all the station models are symmetric about the root column
+
+        Returns:
+            Optional[MirrorSymmetry]: None when the configurations can't be considered symmetric
+        """
+        grid = spec.model.stations.grid
+
+        if 2 * root_position.x != grid.size.x - 1:
+            return None
+
+        for station_model in spec.model.stations.models.values():
+            if not is_mirror_symmetric(station_model, grid.measures.x):
+                return None
+
+        return MirrorSymmetry(GridBitboard.for_size(grid.size.x, grid.size.y))
+
+    def mirror_cells(self, cells: bytes) -> bytes:
+        station_cells = array("H")
+        station_cells.frombytes(cells)
+
+        for station_index, cell in enumerate(station_cells):
+            if cell != UNPLACED_CELL and cell < self._bitboard.cells_count:
+                station_cells[station_index] = self._cell_map[cell]
+
+        return station_cells.tobytes()
+
+    def canonical_key(self, cells: bytes) -> bytes:
+        """Get the same key for a configuration and its mirror"""
+        return min(cells, self.mirror_cells(cells))
+
+    def mirror_state(self, state: PlantState) -> PlantState:
+        occupancy = 0
+        for cell in self._bitboard.iter_indexes(state.occupancy):
+            occupancy |= 1 << self._cell_map[cell]
+
+        return PlantState(occupancy, self.mirror_cells(state.cells))
+
+    def variants(self, state: PlantState) -> list[PlantState]:
+        """Get all the configurations equivalent to a state, starting with the state itself"""
+        mirrored_state = self.mirror_state(state)
+
+        if mirrored_state == state:
+            return [state]
+
+        return [state, mirrored_state]
+
+
+class InterchangeableStations:
+    """Permutations of the cells of interchangeable stations
+
+    The canonical form of a configuration assigns the cells of each group of interchangeable stations in ascending order to the stations of the group, so unplaced stations go last.
+    """
+
+    def __init__(self, groups: list[list[int]]) -> None:
+        self._groups = groups
+
+    @staticmethod
+    def detect(spec: SystemSpecification) -> Optional[InterchangeableStations]:
+        """Get the interchangeable stations of a spec as groups of station indexes
+
+        Returns:
+            Optional[InterchangeableStations]: None when all the stations are different
+        """
+        if not spec.equivalent_stations:
+            return None
+
+        station_indexes = {
+            name: index for index, name in enumerate(spec.model.stations.models.keys())
+        }
+
+        return InterchangeableStations(
+            [
+                [station_indexes[name] for name in group]
+                for group in spec.equivalent_stations
+            ]
+        )
+
+    def canonical_key(self, cells: bytes) -> bytes:
+        """Get the same key for all the configurations that swap interchangeable stations"""
+        station_cells = array("H")
+        station_cells.frombytes(cells)
+
+        for group in self._groups:
+            for station_index, cell in zip(
+                group, sorted(station_cells[index] for index in group)
+            ):
+                station_cells[station_index] = cell
+
+        return station_cells.tobytes()
+
+    def variants(self, state: PlantState) -> list[PlantState]:
+        """Get all the configurations equivalent to a state, starting with the state itself"""
+        station_cells = state.station_cells()
+
+        variants = [state]
+        seen = {state.cells}
+
+        for group_permutations in product(
+            *(permutations(group) for group in self._groups)
+        ):
+            variant_cells = array("H", station_cells)
+            for group, permutation in zip(self._groups, group_permutations):
+                for station_index, other_index in zip(group, permutation):
+                    variant_cells[station_index] = station_cells[other_index]
+
+            key = variant_cells.tobytes()
+            if key not in seen:
+                seen.add(key)
+                variants.append(PlantState(state.occupancy, key))
+
+        return variants
+
+
+class PlantSymmetry:
+    """Symmetries of the configurations of a spec, the mirror symmetry and the interchangeable stations combined"""
+
+    def __init__(
+        self,
+        mirror: Optional[MirrorSymmetry],
+        interchangeable: Optional[InterchangeableStations],
+    ) -> None:
+        self.mirror = mirror
+        self.interchangeable = interchangeable
+
+    @staticmethod
+    def detect(
+        spec: SystemSpecification, root_position: Vector[int], use_mirror: bool = False
+    ) -> Optional[PlantSymmetry]:
+        """Get the symmetries of a spec, the mirror symmetry is only detected if use_mirror is set
+
+        Returns:
+            Optional[PlantSymmetry]: None when the spec has no symmetry
+        """
+        mirror = MirrorSymmetry.detect(spec, root_position) if use_mirror else None
+        interchangeable = InterchangeableStations.detect(spec)
+
+        if mirror is None and interchangeable is None:
+            return None
+
+        return PlantSymmetry(mirror, interchangeable)
+
+    def canonical_key(self, cells: bytes) -> bytes:
+        """Get the same key for all the configurations of a symmetry class"""
+        keys = (
+            [cells] if self.mirror is None else [cells, self.mirror.mirror_cells(cells)]
+        )
+
+        if self.interchangeable is not None:
+            keys = [self.interchangeable.canonical_key(key) for key in keys]
+
+        return min(keys)
+
+    def variants(self, state: PlantState) -> list[PlantState]:
+        """Get all the configurations equivalent to a state, starting with the state itself"""
+        variants = [state] if self.mirror is None else self.mirror.variants(state)
+
+        if self.interchangeable is not None:
+            variants = [
+                permutation
+                for variant in variants
+                for permutation in self.interchangeable.variants(variant)
+            ]
+
+        # The mirror of a configuration can be one of its permutations
+        return list(dict.fromkeys(variants))
+
+
+def is_mirror_symmetric(station_model: StationModel, cell_width: float) -> bool:
+    """Check if the obstacles and storages of a station model are symmetric about the vertical axis of its cell
+
+    Obstacles are defined from the cell origin and storages from the cell center, so they are mirrored about x = cell_width / 2 and x = 0 respectively.
+    """
+
+    def rounded(x: float, y: float) -> tuple[float, float]:
+        return (round(x, COORDINATES_PRECISION), round(y, COORDINATES_PRECISION))
+
+    if station_model.obstacles is not None:
+        obstacles = Counter(
+            frozenset(rounded(point.x, point.y) for point in obstacle)
+            for obstacle in station_model.obstacles
+        )
+        mirrored_obstacles = Counter(
+            frozenset(rounded(cell_width - point.x, point.y) for point in obstacle)
+            for obstacle in station_model.obstacles
+        )
+        if obstacles != mirrored_obstacles:
+            return False
+
+    if station_model.storages is not None:
+
+        def storage_types(storage):
+            return frozenset(
+                (
+                    storage_type.part,
+                    storage_type.add,
+                    storage_type.remove,
+                    tuple(storage_type.requires),
+                )
+                for storage_type in storage.type
+            )
+
+        storages = Counter(
+            (rounded(storage.position.x, storage.position.y), storage_types(storage))
+            for storage in station_model.storages
+        )
+        mirrored_storages = Counter(
+            (rounded(-storage.position.x, storage.position.y), storage_types(storage))
+            for storage in station_model.storages
+        )
+        if storages != mirrored_storages:
+            return False
+
+    return True
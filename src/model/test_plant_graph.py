@@ -0,0 +1,198 @@
+from itertools import combinations
+from math import hypot
+import os
+import unittest
+
+import numpy as np
+import pyvisgraph as vg
+
+from model import Vector
+from model.plant_graph import GraphPlant, path_distance, visibility_graph_cache
+from model.tools import SystemSpecification
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "model.yaml")
+
+# Configurations of model.yaml with stations around both transports, their validity doesn't matter for the graphs
+LAYOUTS = [
+    {
+        "InOut": Vector(2, 0),
+        "Robot1": Vector(1, 1),
+        "PartsStorage": Vector(2, 1),
+        "Press": Vector(2, 2),
+        "Robot2": Vector(2, 3),
+    },
+    {
+        "InOut": Vector(2, 0),
+        "Robot1": Vector(2, 1),
+        "PartsStorage": Vector(1, 1),
+        "Press": Vector(3, 1),
+        "Robot2": Vector(2, 2),
+    },
+]
+
+
+class TestGraphPlant(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        with open(MODEL_PATH, encoding="utf8") as model_file:
+            cls.spec = SystemSpecification(model_stream=model_file)
+
+    def build_plant(self, layout: dict[str, Vector]) -> GraphPlant:
+        plant = GraphPlant(self.spec)
+        for station_name, position in layout.items():
+            plant.set_station_location_by_name(station_name, position)
+        plant.set_ready()
+        plant.build_vis_graphs()
+        return plant
+
+    def free_points(self, plant: GraphPlant, transport_name: str) -> list[Vector]:
+        """Get points spread over the plant outside the obstacles of a transport station"""
+        points = [
+            Vector(0.1 + 0.3 * x, 0.1 + 0.3 * y) for x in range(11) for y in range(11)
+        ]
+        return [
+            point
+            for point in points
+            if not plant.is_point_in_obstacles(point, transport_name)
+        ]
+
+    def test_straight_segments(self):
+        """Clear segments are as long as the visibility graph path, blocked ones are measured on it"""
+        clear_count = detour_count = 0
+
+        for layout in LAYOUTS:
+            plant = self.build_plant(layout)
+
+            for transport_name in ("Robot1", "Robot2"):
+                points = self.free_points(plant, transport_name)
+
+                for start, end in combinations(points[::3], 2):
+                    path_length = path_distance(
+                        plant.get_path_between_two_points_with_transport(
+                            start, end, transport_name
+                        )
+                    )
+                    straight_length = hypot(start.x - end.x, start.y - end.y)
+
+                    self.assertAlmostEqual(
+                        plant.get_distance_between_two_points_with_transport(
+                            start, end, transport_name
+                        ),
+                        path_length,
+                        places=9,
+                    )
+
+                    if plant.is_segment_clear(
+                        start.x, start.y, end.x, end.y, transport_name
+                    ):
+                        clear_count += 1
+                        self.assertAlmostEqual(straight_length, path_length, places=9)
+                    elif path_length > straight_length + 1e-6:
+                        detour_count += 1
+
+                ends = np.array([(point.x, point.y) for point in points])
+                self.assertEqual(
+                    plant.are_segments_clear(points[0], ends, transport_name).tolist(),
+                    [
+                        plant.is_segment_clear(
+                            points[0].x, points[0].y, end.x, end.y, transport_name
+                        )
+                        for end in points
+                    ],
+                )
+
+        self.assertGreater(clear_count, 0)
+        self.assertGreater(detour_count, 0)
+
+    def test_distance_matrix(self):
+        """The distance matrix has the length of the visibility graph path of each pair of points"""
+        for layout in LAYOUTS:
+            plant = self.build_plant(layout)
+
+            for transport_name in ("Robot1", "Robot2"):
+                points = self.free_points(plant, transport_name)[::4]
+                distances = plant.distance_matrix_with_transport(
+                    [vg.Point(point.x, point.y) for point in points], transport_name
+                )
+
+                for origin_index, origin in enumerate(points):
+                    self.assertEqual(distances[origin_index, origin_index], 0)
+
+                    for destiny_index, destiny in enumerate(points):
+                        if destiny_index == origin_index:
+                            continue
+                        self.assertAlmostEqual(
+                            distances[origin_index, destiny_index],
+                            path_distance(
+                                plant.get_path_between_two_points_with_transport(
+                                    origin, destiny, transport_name
+                                )
+                            ),
+                            places=9,
+                        )
+
+    def test_translated_visibility_graphs(self):
+        """A visibility graph taken from the cache and translated is the one built in place"""
+
+        def edges(graph) -> set[frozenset[tuple[float, float]]]:
+            return {
+                frozenset(
+                    (round(point.x, 9), round(point.y, 9))
+                    for point in (edge.p1, edge.p2)
+                )
+                for edge in graph.edges
+            }
+
+        # The same layout one column to the left, every transport has the same obstacles pattern
+        shifted_layout = {
+            station_name: Vector(position.x - 1, position.y)
+            for station_name, position in LAYOUTS[0].items()
+        }
+
+        visibility_graph_cache.clear()
+        built_plant = self.build_plant(shifted_layout)
+        self.assertEqual(built_plant.visibility_graph_hits, 0)
+
+        visibility_graph_cache.clear()
+        self.build_plant(LAYOUTS[0])
+        cached_plant = self.build_plant(shifted_layout)
+        self.assertEqual(cached_plant.visibility_graph_hits, 2)
+        self.assertEqual(cached_plant.visibility_graph_misses, 0)
+
+        for transport_name in ("Robot1", "Robot2"):
+            built_graph = built_plant._vis_graphs[transport_name]
+            cached_graph = cached_plant._vis_graphs[transport_name]
+
+            self.assertEqual(edges(cached_graph.graph), edges(built_graph.graph))
+            self.assertEqual(edges(cached_graph.visgraph), edges(built_graph.visgraph))
+            self.assertEqual(
+                {
+                    geometry.normalize().wkt
+                    for geometry in cached_plant._obstacle_trees[
+                        transport_name
+                    ].geometries
+                },
+                {
+                    geometry.normalize().wkt
+                    for geometry in built_plant._obstacle_trees[
+                        transport_name
+                    ].geometries
+                },
+            )
+
+            points = self.free_points(built_plant, transport_name)
+            self.assertEqual(self.free_points(cached_plant, transport_name), points)
+            for start, end in combinations(points[::5], 2):
+                self.assertEqual(
+                    cached_plant.get_distance_between_two_points_with_transport(
+                        start, end, transport_name
+                    ),
+                    built_plant.get_distance_between_two_points_with_transport(
+                        start, end, transport_name
+                    ),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,205 @@
+import copy
+import pickle
+import unittest
+
+import yaml
+
+from model import ModelSpecificationDict, Vector
+from model.plant import BasePlant
+from model.plant_state import GridBitboard
+from model.symmetry import InterchangeableStations, MirrorSymmetry, PlantSymmetry
+from model.tools import SystemSpecification
+
+storage_station_dict = {
+    "Storage": [
+        {
+            "Type": [{"Part": "Part1", "Add": 1, "Remove": 1}],
+            "Place": {"X": 0.2, "Y": 0.2},
+            "Id": "1",
+        }
+    ]
+}
+
+test_model_dict: ModelSpecificationDict = {
+    "Stations": {
+        "Grid": {
+            "Size": {"X": 4, "Y": 4},
+            "Measures": {"X": 0.8, "Y": 0.8},
+            "BufferSize": 2,
+            "Conveyor": {},
+        },
+        "Models": {
+            "InOut": storage_station_dict,
+            "Storage1": storage_station_dict,
+            "Storage2": storage_station_dict,
+        },
+    },
+    "Parts": {},
+    "Activities": {},
+}
+
+
+class TestPlantState(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.spec = SystemSpecification(model_string=yaml.dump(test_model_dict))
+
+    def test_adjacent_positions(self):
+        """Adjacent positions skip the conveyor row and are ordered by column and then by row"""
+        plant = BasePlant(self.spec)
+        plant.set_station_location_by_name("InOut", Vector(2, 0))
+        plant.set_station_location_by_name("Storage1", Vector(2, 1))
+
+        self.assertEqual(
+            [(p.x, p.y) for p in plant.get_adjacent_positions()],
+            [(1, 1), (2, 2), (3, 1)],
+        )
+
+    def test_bitboard_borders(self):
+        """Neighbours of border cells don't wrap to the next column"""
+        bitboard = GridBitboard(3, 3)
+        occupancy = 1 << bitboard.index(0, 2)
+
+        self.assertEqual(
+            sorted(bitboard.iter_indexes(bitboard.neighbours_mask(occupancy))),
+            sorted([bitboard.index(0, 1), bitboard.index(1, 2)]),
+        )
+
+    def test_export_import_state(self):
+        plant = BasePlant(self.spec)
+        plant.set_station_location_by_name("InOut", Vector(2, 0))
+        plant.set_station_location_by_name("Storage1", Vector(1, 1))
+        plant.set_station_location_by_name("Storage2", 1)
+
+        state = plant.export_state()
+
+        other_plant = BasePlant(self.spec)
+        other_plant.import_state(state)
+
+        self.assertEqual(other_plant.export_state(), state)
+        self.assertEqual(other_plant.occupancy(), plant.occupancy())
+        self.assertEqual(other_plant.get_config_set(), plant.get_config_set())
+        self.assertEqual(len(plant.get_config_key()), 6)
+
+    def test_push_pop_station(self):
+        """Undoing a placement restores the packed state and the adjacent positions"""
+        plant = BasePlant(self.spec)
+        plant.set_station_location_by_name("InOut", Vector(2, 0))
+        plant.push_station("Storage1", Vector(2, 1))
+
+        state = plant.export_state()
+        adjacent_positions = [(p.x, p.y) for p in plant.get_adjacent_positions()]
+
+        plant.push_station("Storage2", Vector(1, 1))
+        self.assertEqual(plant.pop_station(), "Storage2")
+
+        self.assertEqual(plant.export_state(), state)
+        self.assertEqual(plant.occupancy(), state.occupancy)
+        self.assertEqual(
+            [(p.x, p.y) for p in plant.get_adjacent_positions()], adjacent_positions
+        )
+        self.assertIsNone(plant[Vector(1, 1)])
+
+
+class TestVector(unittest.TestCase):
+
+    def test_value_semantics(self):
+        """Vectors are compared and hashed by their coordinates and can't be modified"""
+        position = Vector(1, 2)
+
+        self.assertEqual(position, Vector(1, 2))
+        self.assertNotEqual(position, Vector(2, 1))
+        self.assertEqual({position: "Robot"}[Vector(1, 2)], "Robot")
+        self.assertIs(copy.deepcopy(position), position)
+        self.assertEqual(pickle.loads(pickle.dumps(position)), position)
+
+        bitboard = GridBitboard(3, 3)
+        self.assertEqual(bitboard.position(5), Vector(1, 2))
+        self.assertIs(bitboard.position(5), bitboard.position(5))
+
+        with self.assertRaises(AttributeError):
+            position.x = 3  # type: ignore
+
+
+class TestMirrorSymmetry(unittest.TestCase):
+
+    def test_detect(self):
+        """Symmetry requires the root on the central column and symmetric stations"""
+        spec = SystemSpecification(model_string=yaml.dump(test_model_dict))
+        self.assertIsNone(MirrorSymmetry.detect(spec, Vector(2, 0)))
+
+        symmetric_model_dict = copy.deepcopy(test_model_dict)
+        symmetric_model_dict["Stations"]["Grid"]["Size"]["X"] = 5
+        for station_dict in symmetric_model_dict["Stations"]["Models"].values():
+            station_dict["Storage"][0]["Place"]["X"] = 0.0
+
+        spec = SystemSpecification(model_string=yaml.dump(symmetric_model_dict))
+        self.assertIsNone(MirrorSymmetry.detect(spec, Vector(1, 0)))
+
+        symmetry = MirrorSymmetry.detect(spec, Vector(2, 0))
+        assert symmetry is not None
+
+        # Mirrored configurations can get different results, so the mirror is only used on request
+        plant_symmetry = PlantSymmetry.detect(spec, Vector(2, 0))
+        assert plant_symmetry is not None
+        self.assertIsNone(plant_symmetry.mirror)
+        plant_symmetry = PlantSymmetry.detect(spec, Vector(2, 0), use_mirror=True)
+        assert plant_symmetry is not None
+        self.assertIsNotNone(plant_symmetry.mirror)
+
+        plant = BasePlant(spec)
+        plant.set_station_location_by_name("InOut", Vector(2, 0))
+        plant.set_station_location_by_name("Storage1", Vector(1, 1))
+        mirrored_plant = BasePlant(spec)
+        mirrored_plant.set_station_location_by_name("InOut", Vector(2, 0))
+        mirrored_plant.set_station_location_by_name("Storage1", Vector(3, 1))
+
+        self.assertEqual(
+            symmetry.variants(plant.export_state()),
+            [plant.export_state(), mirrored_plant.export_state()],
+        )
+        self.assertEqual(
+            symmetry.mirror_state(plant.export_state()).occupancy,
+            mirrored_plant.occupancy(),
+        )
+        self.assertEqual(
+            symmetry.canonical_key(plant.get_config_key()),
+            symmetry.canonical_key(mirrored_plant.get_config_key()),
+        )
+
+
+class TestInterchangeableStations(unittest.TestCase):
+
+    def test_detect(self):
+        """Stations with the same storages are interchangeable, swapping them gives the same key"""
+        # InOut has the same storages, but it is the root of the search and it is never moved
+        spec = SystemSpecification(model_string=yaml.dump(test_model_dict))
+        self.assertEqual(spec.equivalent_stations, [["Storage1", "Storage2"]])
+
+        different_model_dict = copy.deepcopy(test_model_dict)
+        different_model_dict["Stations"]["Models"]["InOut"] = {"Activities": ["In"]}
+        spec = SystemSpecification(model_string=yaml.dump(different_model_dict))
+        self.assertEqual(spec.equivalent_stations, [["Storage1", "Storage2"]])
+
+        interchangeable = InterchangeableStations.detect(spec)
+        assert interchangeable is not None
+
+        plant = BasePlant(spec)
+        plant.set_station_location_by_name("InOut", Vector(2, 0))
+        plant.set_station_location_by_name("Storage1", Vector(1, 1))
+        swapped_plant = BasePlant(spec)
+        swapped_plant.set_station_location_by_name("InOut", Vector(2, 0))
+        swapped_plant.set_station_location_by_name("Storage2", Vector(1, 1))
+
+        self.assertEqual(
+            interchangeable.canonical_key(plant.get_config_key()),
+            interchangeable.canonical_key(swapped_plant.get_config_key()),
+        )
+        self.assertEqual(
+            interchangeable.variants(plant.export_state()),
+            [plant.export_state(), swapped_plant.export_state()],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -1,16 +1,24 @@
 from __future__ import annotations
 
 # import library to read a yaml file
+import hashlib
 from io import StringIO, TextIOWrapper
+import json
 from pathlib import Path
+import pyvisgraph as vg
 import yaml
 
 
 from . import (
     ModelSpecification,
     ModelSpecificationDict,
+    StationNameType,
+    Vector,
 )
 
+# Station placed first by the search at a fixed position, it is never interchangeable with other stations
+ROOT_STATION: StationNameType = "InOut"
+
 
 class SystemSpecification:
     """Wrapper class for the system specification model.
@@ -31,3 +39,51 @@ class SystemSpecification:
             raise ValueError("No model source provided")
 
         self.model: ModelSpecification = ModelSpecification(self.yaml_parsed)
+
+        self.equivalent_stations: list[list[StationNameType]] = (
+            self._find_equivalent_stations()
+        )
+
+        # Obstacles of each station model placed in each grid cell, indexed by the cell index of GridBitboard
+        self.absolute_obstacles: dict[StationNameType, list[list[list[vg.Point]]]] = (
+            self._place_obstacles()
+        )
+
+        self._content_hash: str | None = None
+
+    def content_hash(self) -> str:
+        """Get a hash of the parsed model, independent of the yaml formatting and key order"""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(
+                json.dumps(self.yaml_parsed, sort_keys=True).encode()
+            ).hexdigest()
+        return self._content_hash
+
+    def _place_obstacles(self) -> dict[StationNameType, list[list[list[vg.Point]]]]:
+        grid = self.model.stations.grid
+
+        return {
+            station_name: [
+                station_model.get_absolute_obstacles(
+                    Vector(x * grid.measures.x, y * grid.measures.y)
+                )
+                for x in range(grid.size.x)
+                for y in range(grid.size.y)
+            ]
+            for station_name, station_model in self.model.stations.models.items()
+            if station_model.obstacles is not None
+        }
+
+    def _find_equivalent_stations(self) -> list[list[StationNameType]]:
+        """Group the stations with the same geometry and capabilities
+
+        Only groups with more than one station are returned, each group keeps the order of the stations in the model. The root station is left out, as swapping it would move it from its fixed position.
+        """
+        groups: dict[tuple, list[StationNameType]] = {}
+
+        for station_name, station_model in self.model.stations.models.items():
+            if station_name == ROOT_STATION:
+                continue
+            groups.setdefault(station_model.signature(), []).append(station_name)
+
+        return [group for group in groups.values() if len(group) > 1]
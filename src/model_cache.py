@@ -0,0 +1,126 @@
+"""Model cache
+
+Parsed specifications stored on disk with everything derived from them before the search: the process graph with its compiled form, the obstacles of the station models in every grid cell and the reach tables. Entries are pickled to a directory, one file per model, keyed by the hash of the model text and the cache version, so runs on an unchanged model skip the parsing and the precomputations. Only directories written by this module should be used, as loading an entry runs pickle.
+
+Long-lived processes, like the job workers of the server, also keep the models they used recently in memory with a CompiledModelCache.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import os
+import pickle
+import tempfile
+
+from graph.problem import ReachTables
+from graph.process import ManufacturingProcessGraph
+from model.tools import SystemSpecification
+
+# Changed whenever the cached classes change, so old entries are not loaded
+CACHE_VERSION = 5
+
+
+@dataclass
+class CompiledModel:
+    spec: SystemSpecification
+    flow_graph: ManufacturingProcessGraph
+    reach_tables: ReachTables | None = None
+
+
+def compile_model(model_text: str, use_reach_tables: bool = True) -> CompiledModel:
+    """Parse a model and build its process graph, and its reach tables if use_reach_tables is set"""
+    spec = SystemSpecification(model_string=model_text)
+    flow_graph = ManufacturingProcessGraph(spec.model)
+    flow_graph.generate_model_graph()
+
+    return CompiledModel(
+        spec,
+        flow_graph,
+        ReachTables(flow_graph, spec) if use_reach_tables else None,
+    )
+
+
+def load_compiled_model(
+    model_text: str, directory: str, use_reach_tables: bool = True
+) -> CompiledModel:
+    """Get the compiled model of a model text from the cache directory, compiling and storing it if it is not there
+
+    Entries without reach tables are completed when they are needed.
+    """
+    path = os.path.join(directory, f"{model_key(model_text)}.pickle")
+
+    try:
+        with open(path, "rb") as entry_file:
+            compiled_model: CompiledModel = pickle.load(entry_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        compiled_model = compile_model(model_text, use_reach_tables)
+    else:
+        if not use_reach_tables or compiled_model.reach_tables is not None:
+            return compiled_model
+
+        compiled_model.reach_tables = ReachTables(
+            compiled_model.flow_graph, compiled_model.spec
+        )
+
+    _store(path, compiled_model)
+
+    return compiled_model
+
+
+class CompiledModelCache:
+    """LRU cache in memory of compiled models, keyed by model_key
+
+    Models that are not in memory are loaded from the cache directory if one is given, or compiled. The compiled models are only read by the search, so the runs of a model share them.
+    """
+
+    def __init__(self, max_entries: int, directory: str | None = None) -> None:
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: OrderedDict[str, CompiledModel] = OrderedDict()
+
+    def load(self, model_text: str, use_reach_tables: bool = True) -> CompiledModel:
+        key = model_key(model_text)
+        compiled_model = self._entries.get(key)
+
+        if compiled_model is None:
+            compiled_model = (
+                load_compiled_model(model_text, self.directory, use_reach_tables)
+                if self.directory is not None
+                else compile_model(model_text, use_reach_tables)
+            )
+        elif use_reach_tables and compiled_model.reach_tables is None:
+            compiled_model.reach_tables = ReachTables(
+                compiled_model.flow_graph, compiled_model.spec
+            )
+
+        self._entries[key] = compiled_model
+        self._entries.move_to_end(key)
+
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        return compiled_model
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+
+def model_key(model_text: str) -> str:
+    return hashlib.sha256(f"{CACHE_VERSION}\n{model_text}".encode()).hexdigest()
+
+
+def _store(path: str, compiled_model: CompiledModel) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    # Written to a temporary file and renamed, so concurrent runs never read a partial entry
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(file_descriptor, "wb") as entry_file:
+            pickle.dump(compiled_model, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
@@ -0,0 +1,221 @@
+"""Parallel search
+
+The configuration space is split at the first placement levels below the root node. Each configuration with root + split_depth stations is the root of a subtree, and each subtree is generated and checked in a worker process.
+
+To get the same result as the sequential search, every subtree skips the configurations that contain the root of a previous subtree: any configuration that contains a previous root is reachable from it, so the sequential search would have generated it first in that subtree. That way, each configuration is checked exactly once, and merging the results in subtree order gives the same counters and the same best configuration, ties included. With a symmetry, all the variants of the roots (mirrored and with interchangeable stations swapped) are skipped too, as the sequential search discards any configuration equivalent to one it has already generated.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import wait
+from dataclasses import dataclass
+import sys
+from typing import Callable
+
+from evaluation_cache import EvaluationCache
+from graph import TreeNode
+from graph.problem import FeasibilityChecker, PathingLowerBound, ReachTables
+from graph.process import ManufacturingProcessGraph
+from model.plant_state import PlantState
+from model.symmetry import PlantSymmetry
+from model.tools import SystemSpecification
+from support import SearchContext
+from worker_pool import create_pool, worker_state
+
+# Seconds between the progress calls while waiting for a subtree
+PROGRESS_INTERVAL = 0.1
+
+
+@dataclass
+class SubtreeResult:
+    evaluated_nodes: int
+    valid_nodes: int
+    repository_hits: int
+    repository_bytes: int
+    pruned_nodes: dict[int, int]
+    infeasible_nodes: int
+    cache_hits: int
+    cache_misses: int
+    visibility_graph_hits: int
+    visibility_graph_misses: int
+    count_of_valid_configurations: int
+    count_of_total_configurations: int
+    count_error_configurations: int
+    count_of_checked_configurations: int
+    best_performance_ratio: float
+    best_performance_state: PlantState | None
+
+
+def _search_subtree(root: PlantState, excluded: list[PlantState]) -> SubtreeResult:
+    # Worker processes are reused between subtrees, each subtree has its own context and cache counters
+    worker = worker_state()
+    context = worker.search(root, excluded)
+    cache = worker.cache
+
+    return SubtreeResult(
+        evaluated_nodes=context.evaluated_nodes,
+        valid_nodes=context.valid_nodes,
+        repository_hits=context.repository_hits,
+        repository_bytes=sys.getsizeof(context.config_repository),
+        pruned_nodes=context.pruned_nodes,
+        infeasible_nodes=context.infeasible_nodes,
+        cache_hits=cache.hits if cache is not None else 0,
+        cache_misses=cache.misses if cache is not None else 0,
+        visibility_graph_hits=context.visibility_graph_hits,
+        visibility_graph_misses=context.visibility_graph_misses,
+        count_of_valid_configurations=context.count_of_valid_configurations,
+        count_of_total_configurations=context.count_of_total_configurations,
+        count_error_configurations=context.count_error_configurations,
+        count_of_checked_configurations=context.count_of_checked_configurations,
+        best_performance_ratio=context.best_performance_ratio,
+        best_performance_state=context.best_performance_state,
+    )
+
+
+def parallel_search(
+    context: SearchContext,
+    first_node: TreeNode,
+    spec: SystemSpecification,
+    workers: int,
+    split_depth: int = 2,
+    symmetry: PlantSymmetry | None = None,
+    use_bound: bool = False,
+    use_feasibility: bool = False,
+    use_reach_tables: bool = False,
+    cache: EvaluationCache | None = None,
+    flow_graph: ManufacturingProcessGraph | None = None,
+    reach_tables: ReachTables | None = None,
+    progress: Callable[[], None] | None = None,
+) -> None:
+    """Generate and check all the configurations reachable from first_node in a pool of processes
+
+    The results are merged into the context, as the sequential search does.
+
+    Args:
+        context (SearchContext): context of the search, the main process generates the subtree roots in it and the results of the subtrees are added to it
+        first_node (TreeNode): root of the search, usually the InOut station
+        spec (SystemSpecification): system specification, it is sent once to each worker with the process graph and the checkers built from it
+        workers (int): number of worker processes
+        split_depth (int): number of placement levels below the root generated by the main process to split the search in subtrees
+        symmetry (PlantSymmetry | None): symmetry used to generate only one configuration of each symmetry class
+        use_bound (bool): prune the subtrees with the PathingLowerBound. Each worker prunes with the best result of its own subtrees, so the best configuration is the same as in the sequential search but fewer nodes are pruned
+        use_feasibility (bool): skip the subtrees rejected by the FeasibilityChecker
+        use_reach_tables (bool): check the configurations with ReachTables
+        cache (EvaluationCache | None): evaluation cache, each worker opens its own connection to the same database and the hits and misses are added to it
+        flow_graph (ManufacturingProcessGraph | None): process graph of the spec, built when it isn't given
+        reach_tables (ReachTables | None): reach tables of the spec, used when use_reach_tables is set and built when they aren't given
+        progress (Callable[[], None] | None): called while the subtree roots are generated, while waiting for each subtree and after merging its result. If it raises, the subtrees not started yet are cancelled and the running ones are not waited for
+    """
+    station_models = spec.model.stations.models
+
+    root_depth = 0
+    node: TreeNode | None = first_node
+    while node is not None:
+        root_depth += 1
+        node = node.previous
+
+    # Subtree roots can't be complete configurations, at least one station is left for the workers
+    max_depth = min(root_depth + split_depth, len(station_models) - 1)
+
+    if flow_graph is None:
+        flow_graph = ManufacturingProcessGraph(spec.model)
+        flow_graph.generate_model_graph()
+    if not use_reach_tables:
+        reach_tables = None
+    elif reach_tables is None:
+        reach_tables = ReachTables(flow_graph, spec)
+    lower_bound = PathingLowerBound(flow_graph, spec) if use_bound else None
+    feasibility = FeasibilityChecker(flow_graph, spec) if use_feasibility else None
+
+    if max_depth <= root_depth:
+        # Not enough stations to split the search
+        context.check_configurations(
+            context.iterate(
+                first_node,
+                station_models,
+                spec,
+                symmetry=symmetry,
+                lower_bound=lower_bound,
+                feasibility=feasibility,
+                progress=progress,
+            ),
+            flow_graph,
+            spec,
+            cache,
+            reach_tables,
+            progress,
+        )
+        return
+
+    roots = list(
+        context.iterate(
+            first_node, station_models, spec, max_depth, symmetry, progress=progress
+        )
+    )
+
+    excluded_roots: list[list[PlantState]] = [[]]
+    for root in roots[:-1]:
+        excluded_roots.append(
+            excluded_roots[-1]
+            + (symmetry.variants(root) if symmetry is not None else [root])
+        )
+
+    executor = create_pool(
+        workers,
+        spec,
+        flow_graph,
+        reach_tables,
+        symmetry,
+        lower_bound,
+        feasibility,
+        cache.path if cache is not None else None,
+    )
+    try:
+        futures = [
+            executor.submit(_search_subtree, root, excluded)
+            for root, excluded in zip(roots, excluded_roots)
+        ]
+
+        # Results are merged in subtree order, so ties are solved as in the sequential search
+        for future in futures:
+            # A search cancelled by progress stops here without waiting for the subtree
+            if progress is not None:
+                while not wait([future], timeout=PROGRESS_INTERVAL).done:
+                    progress()
+
+            result = future.result()
+            _merge_subtree_result(context, result)
+            if cache is not None:
+                cache.hits += result.cache_hits
+                cache.misses += result.cache_misses
+            if progress is not None:
+                progress()
+    except BaseException:
+        # The running subtrees end in the background, their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+    executor.shutdown()
+
+
+def _merge_subtree_result(context: SearchContext, result: SubtreeResult) -> None:
+    context.evaluated_nodes += result.evaluated_nodes
+    context.valid_nodes += result.valid_nodes
+    context.repository_hits += result.repository_hits
+    context.external_repository_size += result.valid_nodes
+    context.external_repository_bytes += result.repository_bytes
+    context.infeasible_nodes += result.infeasible_nodes
+    # Each worker has its own visibility graph cache, only the lookups are merged
+    context.visibility_graph_hits += result.visibility_graph_hits
+    context.visibility_graph_misses += result.visibility_graph_misses
+    for depth, count in result.pruned_nodes.items():
+        context.pruned_nodes[depth] = context.pruned_nodes.get(depth, 0) + count
+
+    context.count_of_valid_configurations += result.count_of_valid_configurations
+    context.count_of_total_configurations += result.count_of_total_configurations
+    context.count_error_configurations += result.count_error_configurations
+    context.count_of_checked_configurations += result.count_of_checked_configurations
+
+    if result.best_performance_ratio < context.best_performance_ratio:
+        context.best_performance_ratio = result.best_performance_ratio
+        context.best_performance_state = result.best_performance_state
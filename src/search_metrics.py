@@ -0,0 +1,119 @@
+"""Search metrics
+
+Snapshots of the search counters taken while the configurations are checked, so a long search can be followed live: the job API streams them as server-sent events and the command line shows them in a progress line. Snapshots are taken at most every interval seconds, plus a last one when the search ends.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Callable
+
+from evaluation_cache import EvaluationCache
+from model.plant_graph import GraphPlant
+from model.plant_state import PlantState
+from model.tools import SystemSpecification
+from support import SearchContext
+
+# Seconds between two snapshots
+METRICS_INTERVAL = 0.5
+
+MetricsEvent = dict[str, Any]
+
+
+class SearchMetrics:
+    """Source of metrics events of a search, sent to the sink
+
+    update is given to the search as its progress callback, see support.SearchContext.check_configurations.
+    """
+
+    def __init__(
+        self,
+        context: SearchContext,
+        spec: SystemSpecification,
+        sink: Callable[[MetricsEvent], None],
+        interval: float = METRICS_INTERVAL,
+        cache: EvaluationCache | None = None,
+    ) -> None:
+        self._context = context
+        self._spec = spec
+        self._sink = sink
+        self._interval = interval
+        self._cache = cache
+
+        self._start = time.monotonic()
+        self._last_time = self._start
+        self._last_evaluated_nodes = context.evaluated_nodes
+
+        self._best_state: PlantState | None = None
+        self._best_configuration: list | None = None
+
+    def update(self) -> None:
+        if time.monotonic() - self._last_time >= self._interval:
+            self._sink(self.snapshot())
+
+    def finish(self) -> None:
+        self._sink(self.snapshot(finished=True))
+
+    def snapshot(self, finished: bool = False) -> MetricsEvent:
+        """Get the current metrics
+
+        The nodes per second are measured since the previous snapshot, so a stalled search shows up at once.
+        """
+        now = time.monotonic()
+        evaluated_nodes = self._context.evaluated_nodes
+
+        nodes_per_second = (
+            (evaluated_nodes - self._last_evaluated_nodes) / (now - self._last_time)
+            if now > self._last_time
+            else 0.0
+        )
+        self._last_time = now
+        self._last_evaluated_nodes = evaluated_nodes
+
+        best_state = self._context.best_performance_state
+        if best_state is not None and best_state is not self._best_state:
+            self._best_state = best_state
+            best_plant = GraphPlant(self._spec)
+            best_plant.import_state(best_state)
+            self._best_configuration = best_plant.export_config_formated()
+
+        return {
+            **self._context.progress(),
+            "finished": finished,
+            "elapsed_seconds": now - self._start,
+            "nodes_per_second": nodes_per_second,
+            "repository_hit_rate": self._context.hit_rate(),
+            "visibility_graph_cache_hit_rate": self._context.visibility_graph_hit_rate(),
+            "evaluation_cache_hit_rate": (
+                self._cache.hit_rate() if self._cache is not None else None
+            ),
+            "best_configuration": self._best_configuration,
+        }
+
+
+class MetricsProgressLine:
+    """Sink that shows the metrics events in a tqdm progress line, closed by the last event"""
+
+    def __init__(self) -> None:
+        # tqdm is only imported when the progress line is shown
+        from tqdm import tqdm
+
+        self._bar = tqdm(unit=" nodes", dynamic_ncols=True)
+
+    def __call__(self, event: MetricsEvent) -> None:
+        # tqdm shows the nodes per second from the evaluated nodes
+        self._bar.update(event["evaluated_nodes"] - self._bar.n)
+        self._bar.set_postfix(
+            {
+                "checked": event["checked_configurations"],
+                "valid": event["valid_configurations"],
+                "pruned": event["pruned_configurations"],
+                "infeasible": event["infeasible_configurations"],
+                "vis cache": f"{event['visibility_graph_cache_hit_rate']:.0%}",
+                "best": event["best_performance_ratio"],
+            },
+            refresh=True,
+        )
+
+        if event["finished"]:
+            self._bar.close()
@@ -1,12 +1,46 @@
-import sys, json
+import atexit, sys, json, shutil, tempfile
 
 sys.path.append("./src/")
 
 
-from main import process
-from flask import Flask, request
+from jobs import JobManager, JobStatus
+from flask import Flask, Response, request, stream_with_context
 
 app = Flask(__name__)
+# Directory of the model cache, see model_cache. Its entries are unpickled, so it must only be writable by the user running the server. By default a private temporary directory is created for the server
+app.config.setdefault("MODEL_CACHE_DIR", None)
+# Each job worker stores the results of the configurations it checks in its own database in this directory, a private temporary directory by default
+app.config.setdefault("EVALUATION_CACHE_DIR", None)
+# Worker processes of the searches, the jobs wait when all of them are busy
+app.config.setdefault("JOB_WORKERS", 2)
+# Seconds without job changes before a comment is sent to keep the event stream open
+app.config.setdefault("EVENTS_KEEP_ALIVE", 15)
+
+job_manager: JobManager | None = None
+
+
+def get_job_manager() -> JobManager:
+    global job_manager  # pylint: disable=global-statement
+
+    if job_manager is None:
+        for name in ("MODEL_CACHE_DIR", "EVALUATION_CACHE_DIR"):
+            if app.config[name] is None:
+                app.config[name] = _private_directory(name.lower())
+
+        job_manager = JobManager(
+            app.config["JOB_WORKERS"],
+            app.config["MODEL_CACHE_DIR"],
+            app.config["EVALUATION_CACHE_DIR"],
+        )
+
+    return job_manager
+
+
+def _private_directory(name: str) -> str:
+    """Create a temporary directory only accessible by the current user, removed when the server exits"""
+    directory = tempfile.mkdtemp(prefix=f"plant_{name}_")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return directory
 
 
 @app.route("/")
@@ -16,13 +50,92 @@ def redirect_to_editor():
 
 @app.route("/run", methods=["POST"])
 def run():
+    """Run a search in the job workers and wait for its result"""
+    manager = get_job_manager()
+
+    job = manager.submit(request.get_data().decode())
+    manager.wait(job.id)
+    manager.remove(job.id)
+
+    # The traceback of a failed search is logged by the job manager, only its last line is returned
+    if job.status == JobStatus.INVALID:
+        return {"error": job.error}, 400
+    if job.status != JobStatus.DONE:
+        return {"error": job.error}, 500
+
+    assert job.result is not None
+    return json.dumps(job.result["plant_grid"])
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    job = get_job_manager().submit(request.get_data().decode())
+
+    return job.to_dict(), 202, {"Location": f"/jobs/{job.id}"}
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+
+    if job is None:
+        return {"error": f"Job {job_id} not found"}, 404
+
+    return job.to_dict()
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id: str):
+    """Stream the state of a job as server-sent events until it finishes
+
+    Each change of the job is sent as a metrics event while it is pending or running, and as an event named after its final status when it finishes.
+    """
+    manager = get_job_manager()
+
+    if manager.get(job_id) is None:
+        return {"error": f"Job {job_id} not found"}, 404
+
+    def events():
+        version = -1
+
+        while True:
+            job = manager.wait_for_update(
+                job_id, version, app.config["EVENTS_KEEP_ALIVE"]
+            )
+
+            if job is None:
+                return
+
+            if job.version == version:
+                yield ": keep-alive\n\n"
+                continue
+
+            version = job.version
+            event = job.status.value if job.status.finished() else "metrics"
+            yield f"event: {event}\ndata: {json.dumps(job.to_dict())}\n\n"
+
+            if job.status.finished():
+                return
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
 
-    data_string = request.get_data().decode()
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def delete_job(job_id: str):
+    """Cancel a job if it is pending or running and forget it"""
+    job = get_job_manager().remove(job_id)
 
-    plant_grid = process(model_string=data_string)
+    if job is None:
+        return {"error": f"Job {job_id} not found"}, 404
 
-    return json.dumps(plant_grid, default=lambda obj: obj.name)
+    return job.to_dict()
 
 
 if __name__ == "__main__":
+    # The workers are started before the first request
+    get_job_manager()
     app.run()
@@ -1,56 +1,111 @@
+let currentJob = null
+
 function request() {
     console.log("Send function request");
 
+    if (currentJob != null) {
+        // Only one search at a time from the editor, the previous one is cancelled
+        fetch(`/jobs/${currentJob}`, { method: "DELETE" })
+    }
+
+    postData("/jobs", window.editor.getValue()).then((job) => {
+        currentJob = job.id
+        pollJob(job.id)
+    });
+}
+
+function pollJob(jobId) {
+    // The job state is streamed by the server on every change
+    let events = new EventSource(`/jobs/${jobId}/events`)
+
+    let finish = (job) => {
+        events.close()
+
+        if (jobId != currentJob) {
+            return
+        }
+
+        currentJob = null
+        document.querySelector("#run").innerText = "Run app"
+
+        if (job.status == "done") {
+            showResult(job.result.plant_grid)
+        } else if (job.status == "invalid") {
+            alert(job.error)
+        } else if (job.status == "failed") {
+            console.error(job.error)
+            alert("The search failed, see the console for details")
+        }
+    }
+
+    events.addEventListener("metrics", (event) => {
+        if (jobId == currentJob) {
+            showProgress(JSON.parse(event.data))
+        }
+    })
+    events.addEventListener("done", (event) => finish(JSON.parse(event.data)))
+    events.addEventListener("failed", (event) => finish(JSON.parse(event.data)))
+    events.addEventListener("invalid", (event) => finish(JSON.parse(event.data)))
+    events.addEventListener("cancelled", (event) => finish(JSON.parse(event.data)))
+}
+
+function showProgress(job) {
+    let progress = job.progress
+    document.querySelector("#run").innerText = job.status == "pending"
+        ? "Waiting..."
+        : `Running: ${Math.round(progress.nodes_per_second ?? 0)} nodes/s, ${progress.checked_configurations ?? 0} checked, best ${progress.best_performance_ratio ?? "-"}`
+}
 
+function showResult(data) {
+    if (data == null) {
+        alert("No valid configuration found")
+        return
+    }
 
-    postData("/run", window.editor.getValue()).then((data) => {
-        console.log(); // JSON data parsed by `data.json()` call
+    window.localStorage.setItem("result", JSON.stringify(data))
 
-        window.localStorage.setItem("result", JSON.stringify(data))
+    document.querySelector("#result").classList.add("active")
 
-        document.querySelector("#result").classList.add("active")
+    let resultsNode = document.querySelector("#result-content")
+    let table = document.createElement("table")
+    table.classList.add("plant-grid")
+    resultsNode.appendChild(table)
 
-        let resultsNode = document.querySelector("#result-content")
-        let table = document.createElement("table")
-        table.classList.add("plant-grid")
-        resultsNode.appendChild(table)
+    let thead = document.createElement("thead")
+    table.appendChild(thead)
+    let tr = document.createElement("tr")
+    thead.appendChild(tr)
+    let th = document.createElement("th")
+    th.classList.add("index")
+    tr.appendChild(th)
+    data.forEach((column, column_index) => {
+        let th = document.createElement("th")
+        th.innerText = column_index + 1
+        tr.appendChild(th)
+    });
 
-        let thead = document.createElement("thead")
-        table.appendChild(thead)
+    let tbody = document.createElement("tbody")
+    table.appendChild(tbody)
+    data.forEach((row, row_index) => {
         let tr = document.createElement("tr")
-        thead.appendChild(tr)
+        tbody.appendChild(tr)
         let th = document.createElement("th")
+        th.innerText = row_index + 1
         th.classList.add("index")
         tr.appendChild(th)
-        data.forEach((column, column_index) => {
-            let th = document.createElement("th")
-            th.innerText = column_index + 1
-            tr.appendChild(th)
-        });
-
-        let tbody = document.createElement("tbody")
-        table.appendChild(tbody)
-        data.forEach((row, row_index) => {
-            let tr = document.createElement("tr")
-            tbody.appendChild(tr)
-            let th = document.createElement("th")
-            th.innerText = row_index + 1
-            th.classList.add("index")
-            tr.appendChild(th)
-            row.forEach((cell, column_index) => {
-                let td = document.createElement("td")
-                td.classList.add("plant-grid_station")
-                if (cell != null) {
-                    td.classList.add("plant-grid_active")
-                }
-                td.id = `plant-grid-${column_index}-${row_index}`
-                cell != null ? td.innerHTML = `<p>${cell}</p>` : td.innerHTML = `<p> </p>`
-                tr.appendChild(td)
-            })
-
-        });
+        row.forEach((cell, column_index) => {
+            let td = document.createElement("td")
+            td.classList.add("plant-grid_station")
+            if (cell != null) {
+                td.classList.add("plant-grid_active")
+            }
+            td.id = `plant-grid-${column_index}-${row_index}`
+            cell != null ? td.innerHTML = `<p>${cell}</p>` : td.innerHTML = `<p> </p>`
+            tr.appendChild(td)
+        })
 
     });
+
 }
 
 async function postData(url = "", data = {}) {
@@ -1,120 +1,316 @@
+from itertools import combinations
 import random
+import sys
+from typing import Callable, Iterable, Iterator, Sequence
+from evaluation_cache import EvaluationCache
 from graph import TreeNode
 from graph.process import ManufacturingProcessGraph
 from model import StationModel, Vector
+from model.plant import PlantConfigKeyType
 from model.plant_graph import GraphPlant
+from model.plant_state import UNPLACED_CELL, PlantState
+from model.symmetry import PlantSymmetry
 from model.tools import SystemSpecification
 import graph.problem as graph_problem
 
 
-class populate_next_nodes:
+class SearchContext:
+    """State of one search: the repository of generated configurations, the counters and the best configuration found
+
+    Each run creates its own context, so runs in different threads or processes don't share anything and the repository is released with the context when the run ends.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self) -> None:
+        self.config_repository: set[PlantConfigKeyType] = set()
+        self.evaluated_nodes = 0
+        self.valid_nodes = 0
+        self.repository_hits = 0
+        # Nodes discarded by the lower bound, by number of placed stations
+        self.pruned_nodes: dict[int, int] = {}
+        # Nodes discarded because no configuration extending them can be valid
+        self.infeasible_nodes = 0
+        # Filled by the parallel search with the repositories kept by the worker processes
+        self.external_repository_size = 0
+        self.external_repository_bytes = 0
+        # Lookups of the plants of the run in the process-wide visibility graph cache
+        self.visibility_graph_hits = 0
+        self.visibility_graph_misses = 0
+
+        self.count_of_valid_configurations = 0
+        self.count_of_total_configurations = 0
+        self.count_error_configurations = 0
+        self.count_of_checked_configurations = 0
+        self.best_performance_ratio = 999999999999999.9
+        self.best_performance_state: PlantState | None = None
+
+    def hit_rate(self) -> float:
+        """Ratio of generated nodes discarded because their configuration was already in the repository"""
+        if self.evaluated_nodes == 0:
+            return 0.0
+        return self.repository_hits / self.evaluated_nodes
+
+    def visibility_graph_hit_rate(self) -> float:
+        """Ratio of the transport visibility graphs of the run taken from the visibility graph cache"""
+        lookups = self.visibility_graph_hits + self.visibility_graph_misses
+        if lookups == 0:
+            return 0.0
+        return self.visibility_graph_hits / lookups
+
+    def repository_size(self) -> tuple[int, int]:
+        """Get the number of configurations in the repository and its size in bytes, including the repositories of worker processes"""
+        return (
+            len(self.config_repository) + self.external_repository_size,
+            sys.getsizeof(self.config_repository) + self.external_repository_bytes,
+        )
 
-    config_repository = [set("")]
-    evaluated_nodes = 0
-    valid_nodes = 0
+    def progress(self) -> dict[str, int | float | None]:
+        """Get the counters of the search, including the results merged from worker processes
 
-    @staticmethod
-    def __new__(
-        cls,
+        The best ratio is None until a valid configuration is found.
+        """
+        return {
+            "evaluated_nodes": self.evaluated_nodes,
+            "generated_configurations": self.valid_nodes,
+            "infeasible_configurations": self.infeasible_nodes,
+            "pruned_configurations": sum(self.pruned_nodes.values()),
+            "checked_configurations": self.count_of_total_configurations,
+            "valid_configurations": self.count_of_valid_configurations,
+            "error_configurations": self.count_error_configurations,
+            "best_performance_ratio": (
+                self.best_performance_ratio
+                if self.best_performance_state is not None
+                else None
+            ),
+        }
+
+    def iterate(
+        self,
         node: TreeNode,
         station_models: dict[str, StationModel],
         spec: SystemSpecification,
-        # config_repository: set[set[str]],
-    ):
-        """Generate search tree of possible configurations
-
-        It generates the tree recursively. It creates a new node for each station model that could be placed in the plant, and then calls itself with the new node.
-        To avoid infinite loops, it keeps track of the station models that have already been used in the current branch of the tree.
-        It also keeps track of the configurations that have already been generated, to avoid duplicates.
-        To do so, it uses a set of strings, where each string represents a configuration of the plant. Once the new node is created, it is set as a child of the current node, but the current node is not set as a parent of the new node. Then the function calls itself with the new node as an argument.
-        At the beginning of the function, it creates a new plant from the new node previously created (it only requires child nodes to have their parent defined). Then this plant is compared to the repo and if it is a new configuration that didn't exist the new_node is set as a child of its parent node.
-        Otherwise, the function terminates, and the new node is then distroyed because its reference is lost and its, theoretically, parent didn't have a reference to it.
-        """
-        populate_next_nodes.evaluated_nodes += 1
+        max_depth: int | None = None,
+        symmetry: PlantSymmetry | None = None,
+        lower_bound: graph_problem.PathingLowerBound | None = None,
+        feasibility: graph_problem.FeasibilityChecker | None = None,
+        progress: Callable[[], None] | None = None,
+    ) -> Iterator[PlantState]:
+        """Generate the complete configurations reachable from a node without building the tree
+
+        The configurations are visited depth first, placing each unused station model in each adjacent position in turn, and each configuration is stored in the repository by its key (see BasePlant.get_config_key) so the ones already generated in another branch are skipped. It uses an explicit stack of candidate iterators instead of recursion, so the depth is not limited by the Python recursion limit. Only the candidates of the current branch are kept in memory, and each complete configuration is yielded as a PlantState as soon as it is found. The search stops when the consumer stops iterating.
+
+        If a symmetry is given, configurations are stored in the repository by their canonical key, so only the first configuration of each symmetry class is generated.
+
+        If a lower bound is given, the search is a branch and bound: the subtree of any configuration whose bound is not lower than best_performance_ratio is pruned, see iterate_plant. As the configurations are checked while they are generated, the incumbent result improves during the search.
+
+        If a feasibility checker is given, the subtrees of the configurations that can't lead to any valid configuration are not generated, see iterate_plant.
 
+        If progress is given, it is called for each generated node, so it can read the counters of the context while the configurations are generated, see check_configurations.
+        """
         plant, station_models_used = (
             graph_problem.create_plant_from_node_with_station_models_used(node, spec)
         )
 
-        new_config_set = plant.get_config_set()
-
-        for config_set in populate_next_nodes.config_repository:
-            if new_config_set == config_set:
-                return
-
-        populate_next_nodes.config_repository.append(new_config_set)
-        populate_next_nodes.valid_nodes += 1
+        self.evaluated_nodes += 1
+        root_config_key = plant.get_config_key()
+        if symmetry is not None:
+            root_config_key = symmetry.canonical_key(root_config_key)
+        if root_config_key in self.config_repository:
+            self.repository_hits += 1
+            return
+        self.config_repository.add(root_config_key)
+        self.valid_nodes += 1
+
+        yield from self.iterate_plant(
+            plant,
+            station_models_used,
+            station_models,
+            max_depth,
+            symmetry=symmetry,
+            lower_bound=lower_bound,
+            feasibility=feasibility,
+            progress=progress,
+        )
 
-        if node.previous is not None:
-            node.previous.next.append(node)
+    def iterate_plant(
+        self,
+        plant: GraphPlant,
+        station_models_used: set[str],
+        station_models: dict[str, StationModel],
+        max_depth: int | None = None,
+        excluded: Sequence[PlantState] = (),
+        symmetry: PlantSymmetry | None = None,
+        lower_bound: graph_problem.PathingLowerBound | None = None,
+        feasibility: graph_problem.FeasibilityChecker | None = None,
+        progress: Callable[[], None] | None = None,
+    ) -> Iterator[PlantState]:
+        """Generate the configurations that extend the current plant configuration
+
+        The plant configuration itself is not counted nor yielded. If max_depth is given, configurations with max_depth stations are yielded and not expanded. Configurations containing any of the excluded ones are counted as repository hits, as they belong to a subtree that has already been generated. The plant configuration must not contain any of them, see _contains_excluded.
+
+        Configurations pruned by the lower bound are stored in the repository, as any equivalent configuration has the same bound, and counted in pruned_nodes by their number of stations. Configurations rejected by the feasibility checker are stored in the repository too and counted in infeasible_nodes. If progress is given, it is called for each generated node.
+        """
+        # Placements of the excluded configurations, grouped by their number of stations
+        excluded_placements: dict[int, set[tuple[tuple[int, int], ...]]] = {}
+        for state in excluded:
+            placements = tuple(state.placements())
+            excluded_placements.setdefault(len(placements), set()).add(placements)
+
+        # The station models are the ones of the spec, in the order of the packed cells
+        station_indexes = {name: index for index, name in enumerate(station_models)}
+        station_cells = plant.station_cells()
+
+        def next_candidates() -> Iterator[tuple[Vector[int], str]]:
+            return iter(
+                [
+                    (position, value.name)
+                    for position in plant.get_adjacent_positions()
+                    for value in station_models.values()
+                    if value.name not in station_models_used
+                ]
+            )
 
-        available_positions_array = plant.get_adjacent_positions()
+        # Each iterator after the first one belongs to a station placed in the plant
+        stack: list[Iterator[tuple[Vector[int], str]]] = [next_candidates()]
 
-        for position in available_positions_array:
-            for value in station_models.values():
-                if value.name in station_models_used:
-                    continue
+        while stack:
+            candidate = next(stack[-1], None)
 
-                new_node = TreeNode(value, position, node)
+            if candidate is None:
+                stack.pop()
+                if stack:
+                    station_models_used.remove(plant.pop_station())
+                continue
 
-                populate_next_nodes(new_node, station_models, spec)
+            position, station_name = candidate
 
+            plant.push_station(station_name, position)
+            station_models_used.add(station_name)
 
-class check_configuration_each_leave:
+            self.evaluated_nodes += 1
+            if progress is not None:
+                progress()
 
-    count_of_valid_configurations = 0
-    count_of_total_configurations = 0
-    count_error_configurations = 0
-    other_config_values: list = []
-    count_of_checked_configurations = 0
-    best_performance_ratio = 999999999999999.9
-    best_performance_node: TreeNode | None = None
+            new_config_key = plant.get_config_key()
+            if symmetry is not None:
+                new_config_key = symmetry.canonical_key(new_config_key)
 
-    @staticmethod
-    def __new__(
-        cls,
-        node: TreeNode,
+            if new_config_key in self.config_repository or (
+                excluded_placements
+                and _contains_excluded(
+                    station_cells, station_indexes[station_name], excluded_placements
+                )
+            ):
+                self.repository_hits += 1
+                station_models_used.remove(plant.pop_station())
+                continue
+
+            self.config_repository.add(new_config_key)
+            self.valid_nodes += 1
+
+            if feasibility is not None and feasibility.rejects(
+                station_cells, plant.occupancy(), len(station_models_used)
+            ):
+                self.infeasible_nodes += 1
+                station_models_used.remove(plant.pop_station())
+                continue
+
+            if lower_bound is not None and lower_bound.prunes(
+                station_cells, self.best_performance_ratio
+            ):
+                depth = len(station_models_used)
+                self.pruned_nodes[depth] = self.pruned_nodes.get(depth, 0) + 1
+                station_models_used.remove(plant.pop_station())
+                continue
+
+            if len(station_models_used) == len(station_models) or (
+                max_depth is not None and len(station_models_used) >= max_depth
+            ):
+                yield plant.export_state()
+                station_models_used.remove(plant.pop_station())
+                continue
+
+            stack.append(next_candidates())
+
+    def check_configurations(
+        self,
+        configurations: Iterable[PlantState],
         flow_graph: ManufacturingProcessGraph,
         spec: SystemSpecification,
-    ):
+        cache: EvaluationCache | None = None,
+        reach_tables: graph_problem.ReachTables | None = None,
+        progress: Callable[[], None] | None = None,
+    ) -> None:
+        """Check a stream of complete configurations, as generated by iterate
 
-        if len(node.next) < 1:
-            plant, _ = graph_problem.create_plant_from_node_with_station_models_used(
-                node, spec
-            )
+        It updates the configuration counters, including the visibility graph cache lookups of the plant, and stores the best configuration as a PlantState in best_performance_state. A single plant is reused for every configuration.
+
+        If a cache is given, it is consulted before building the visibility graphs of each configuration, and the new results are stored in it. The reach_tables are passed to check_configuration_v2. If progress is given, it is called before checking each configuration, so it can read the counters of the context while the search runs.
+        """
+        plant = GraphPlant(spec)
+        visibility_graph_hits = self.visibility_graph_hits
+        visibility_graph_misses = self.visibility_graph_misses
+
+        for state in configurations:
+            if progress is not None:
+                progress()
 
-            check_configuration_each_leave.count_of_total_configurations += 1
+            self.count_of_total_configurations += 1
+
+            result = cache.get(state) if cache is not None else None
+
+            if result is None:
+                plant.import_state(state)
+                plant.set_ready()
+
+                result = graph_problem.check_configuration_v2(
+                    plant, flow_graph, reach_tables
+                )
+                self.visibility_graph_hits = (
+                    visibility_graph_hits + plant.visibility_graph_hits
+                )
+                self.visibility_graph_misses = (
+                    visibility_graph_misses + plant.visibility_graph_misses
+                )
 
-            result = graph_problem.check_configuration_v2(plant, flow_graph)
+                if cache is not None:
+                    cache.put(state, result)
 
-            if result:
-                # print("Configuration valid")
-                check_configuration_each_leave.count_of_valid_configurations += 1
-            else:
-                check_configuration_each_leave.count_error_configurations += 1
-                return False
+            if not result:
+                self.count_error_configurations += 1
+                continue
 
-            check_configuration_each_leave.count_of_checked_configurations += 1
+            self.count_of_valid_configurations += 1
+            self.count_of_checked_configurations += 1
 
-            if result < check_configuration_each_leave.best_performance_ratio:
-                check_configuration_each_leave.best_performance_ratio = result
-                check_configuration_each_leave.best_performance_node = node
+            if result < self.best_performance_ratio:
+                self.best_performance_ratio = result
+                self.best_performance_state = state
 
-            return True
 
-        for next_node in node.next:
-            check_configuration_each_leave(next_node, flow_graph, spec)
+def _contains_excluded(
+    station_cells: Sequence[int],
+    station_index: int,
+    excluded_placements: dict[int, set[tuple[tuple[int, int], ...]]],
+) -> bool:
+    """Check if a configuration contains an excluded one with its last placed station
 
-        at_least_one_valid = False
+    The configuration before the last placement was extended, so it doesn't contain any excluded configuration and only the excluded ones with the last placed station have to be looked up. Each combination of the other placements is looked up in the set of its size, so the cost doesn't depend on the number of excluded configurations.
+    """
+    last_placement = (station_index, station_cells[station_index])
+    other_placements = [
+        (index, cell)
+        for index, cell in enumerate(station_cells)
+        if cell != UNPLACED_CELL and index != station_index
+    ]
 
-        for index in range(len(node.next) - 1, -1, -1):
-            # print(f"Checking {index}")
-            if check_configuration_each_leave(node.next[index], flow_graph, spec):
-                at_least_one_valid = True
-            else:
-                del node.next[index]
+    for size, placements in excluded_placements.items():
+        for combination in combinations(other_placements, size - 1):
+            if tuple(sorted((*combination, last_placement))) in placements:
+                return True
 
-        return at_least_one_valid
+    return False
 
 
 def get_random_plant(system_specification: SystemSpecification):
@@ -145,7 +341,7 @@ def get_random_plant(system_specification: SystemSpecification):
         if station_models_used == system_specification.model.stations.available_models:
             break
 
-    plant.ready()
+    plant.set_ready()
 
     return plant
 
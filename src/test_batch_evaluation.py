@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+import yaml
+
+from batch_evaluation import BatchEvaluator
+from graph.problem import check_configuration_v2
+from graph.process import ManufacturingProcessGraph
+from model import Vector
+from model.plant_graph import GraphPlant
+from model.tools import SystemSpecification
+from model.test_plant_graph import LAYOUTS, MODEL_PATH
+from model.test_plant_state import test_model_dict
+
+
+class TestBatchEvaluator(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.spec = SystemSpecification(model_string=yaml.dump(test_model_dict))
+
+        plant = GraphPlant(self.spec)
+        plant.set_station_location_by_name("InOut", Vector(2, 0))
+        plant.set_station_location_by_name("Storage1", Vector(1, 1))
+        self.partial_state = plant.export_state()
+
+        plant.set_station_location_by_name("Storage2", Vector(2, 1))
+        self.state = plant.export_state()
+
+        flow_graph = ManufacturingProcessGraph(self.spec.model)
+        flow_graph.generate_model_graph()
+        plant.set_ready()
+        self.result = check_configuration_v2(plant, flow_graph)
+
+    def test_results_in_order(self):
+        """Results match check_configuration_v2 in the current process and in the pool"""
+        layouts = [self.state, self.partial_state] * 3
+
+        for workers in (1, 2):
+            with BatchEvaluator(self.spec, workers, chunk_size=2) as evaluator:
+                self.assertEqual(
+                    list(evaluator.evaluate_many(layouts)),
+                    [self.result, False] * 3,
+                )
+
+    def test_evaluators_in_the_same_process(self):
+        """An evaluator in the current process is not changed by creating another one"""
+        with open(MODEL_PATH, encoding="utf8") as model_file:
+            model_dict = yaml.safe_load(model_file)
+        for station_dict in model_dict["Stations"]["Models"].values():
+            if "Transport" in station_dict:
+                station_dict["Transport"]["Range"] = 2.5
+        spec = SystemSpecification(model_string=yaml.dump(model_dict))
+
+        plant = GraphPlant(spec)
+        for station_name, position in LAYOUTS[0].items():
+            plant.set_station_location_by_name(station_name, position)
+        state = plant.export_state()
+
+        flow_graph = ManufacturingProcessGraph(spec.model)
+        flow_graph.generate_model_graph()
+        plant.set_ready()
+        result = check_configuration_v2(plant, flow_graph)
+        self.assertGreater(result, 0)
+
+        with BatchEvaluator(spec) as evaluator:
+            with BatchEvaluator(self.spec, use_reach_tables=False):
+                self.assertEqual(list(evaluator.evaluate_many([state])), [result])
+
+    def test_invalid_layouts_are_nan(self):
+        with BatchEvaluator(self.spec) as evaluator:
+            results = evaluator.evaluate_array([self.state, self.partial_state])
+
+        self.assertEqual(results[0], self.result)
+        self.assertTrue(np.isnan(results[1]))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,97 @@
+import copy
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import yaml
+
+from evaluation_cache import COMMIT_INTERVAL, EvaluationCache
+from model import Vector
+from model.plant import BasePlant
+from model.plant_state import PlantState
+from model.symmetry import PlantSymmetry
+from model.tools import SystemSpecification
+from model.test_plant_state import test_model_dict
+
+
+class TestEvaluationCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.spec = SystemSpecification(model_string=yaml.dump(test_model_dict))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.db")
+
+    def test_results_are_kept_between_runs(self):
+        cache = EvaluationCache(self.path, self.spec)
+        cache.put(PlantState(0, b"\x01\x00"), 12.5)
+        cache.put(PlantState(0, b"\x02\x00"), False)
+        cache.close()
+
+        cache = EvaluationCache(self.path, self.spec)
+        self.assertEqual(cache.get(PlantState(0, b"\x01\x00")), 12.5)
+        self.assertIs(cache.get(PlantState(0, b"\x02\x00")), False)
+        self.assertIsNone(cache.get(PlantState(0, b"\x03\x00")))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_evict_least_recently_used(self):
+        cache = EvaluationCache(self.path, self.spec, max_entries=2)
+        for index in range(3):
+            cache.put(PlantState(0, bytes([index, 0])), float(index))
+        cache.get(PlantState(0, b"\x00\x00"))
+
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.get(PlantState(0, b"\x01\x00")))
+        self.assertEqual(cache.get(PlantState(0, b"\x00\x00")), 0.0)
+
+    def test_shared_database(self):
+        """Reads don't lock the database, and changes are written every COMMIT_INTERVAL changes"""
+        cache = EvaluationCache(self.path, self.spec)
+        cache.put(PlantState(0, b"\x01\x00"), 12.5)
+        cache.flush()
+        self.assertEqual(cache.get(PlantState(0, b"\x01\x00")), 12.5)
+
+        # Another process writes while the first one keeps reading
+        other_cache = EvaluationCache(self.path, self.spec)
+        other_cache._connection.execute("PRAGMA busy_timeout = 0")
+        other_cache.put(PlantState(0, b"\x02\x00"), False)
+        other_cache.close()
+        self.assertIs(cache.get(PlantState(0, b"\x02\x00")), False)
+
+        for index in range(COMMIT_INTERVAL):
+            cache.put(PlantState(1, index.to_bytes(2, "little")), float(index))
+
+        connection = sqlite3.connect(self.path)
+        (count,) = connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()
+        connection.close()
+        self.assertGreaterEqual(count, COMMIT_INTERVAL)
+        cache.close()
+
+    def test_mirrored_configurations_are_not_shared(self):
+        """Only the configurations that swap interchangeable stations share an entry"""
+        symmetric_model_dict = copy.deepcopy(test_model_dict)
+        symmetric_model_dict["Stations"]["Grid"]["Size"]["X"] = 5
+        for station_dict in symmetric_model_dict["Stations"]["Models"].values():
+            station_dict["Storage"][0]["Place"]["X"] = 0.0
+        spec = SystemSpecification(model_string=yaml.dump(symmetric_model_dict))
+
+        symmetry = PlantSymmetry.detect(spec, Vector(2, 0), use_mirror=True)
+        assert symmetry is not None and symmetry.mirror is not None
+
+        plant = BasePlant(spec)
+        plant.set_station_location_by_name("InOut", Vector(2, 0))
+        plant.set_station_location_by_name("Storage1", Vector(1, 1))
+        state = plant.export_state()
+
+        cache = EvaluationCache(self.path, spec, symmetry)
+        cache.put(state, 12.5)
+
+        self.assertIsNone(cache.get(symmetry.mirror.mirror_state(state)))
+        for variant in symmetry.interchangeable.variants(state):  # type: ignore
+            self.assertEqual(cache.get(variant), 12.5)
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
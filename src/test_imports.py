@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Modules only needed to plot, export or serve, they must not be imported by a search run
+LAZY_MODULES = ["matplotlib", "pyvis", "networkx", "IPython", "flask"]
+
+# Seconds to import the search modules in a new interpreter, it is far above the usual time so only a heavy import exceeds it
+IMPORT_TIME_BUDGET = 2.0
+
+IMPORT_BENCHMARK = """
+import json, sys, time
+start = time.perf_counter()
+import main, parallel, batch_evaluation
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+class TestImports(unittest.TestCase):
+
+    def test_search_startup(self):
+        """The search modules don't import the visualization, export and server libraries, and load within the budget"""
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_BENCHMARK],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        benchmark = json.loads(output.splitlines()[-1])
+
+        imported_modules = {name.split(".")[0] for name in benchmark["modules"]}
+        self.assertEqual(
+            [name for name in LAZY_MODULES if name in imported_modules], []
+        )
+        self.assertLess(benchmark["elapsed"], IMPORT_TIME_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,182 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import yaml
+
+from jobs import JobManager, JobStatus
+from model.test_plant_state import test_model_dict
+import server
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "model.yaml")
+
+
+def long_model_dict() -> dict:
+    """Get model.yaml on an 8x8 grid with long transport ranges, its search runs for a few seconds"""
+    with open(MODEL_PATH, encoding="utf8") as model_file:
+        model_dict: dict = yaml.safe_load(model_file)
+
+    model_dict["Stations"]["Grid"]["Size"] = {"X": 8, "Y": 8}
+    for station_dict in model_dict["Stations"]["Models"].values():
+        if "Transport" in station_dict:
+            station_dict["Transport"]["Range"] = 6.0
+
+    return model_dict
+
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.manager = JobManager(max_workers=1)
+        self.model_text = yaml.dump(test_model_dict)
+
+    def tearDown(self) -> None:
+        self.manager.close()
+
+    def wait(self, job_id: str) -> None:
+        deadline = time.monotonic() + 60
+        while not self.manager.get(job_id).status.finished():  # type: ignore
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+    def test_run_and_cancel(self):
+        """Jobs over the worker limit wait, a pending job can be cancelled and the others report their result, a model that can't be parsed is invalid"""
+        first_job = self.manager.submit(self.model_text)
+        cancelled_job = self.manager.submit(self.model_text)
+        invalid_job = self.manager.submit("Stations: [")
+
+        self.assertEqual(first_job.status, JobStatus.RUNNING)
+        self.assertEqual(cancelled_job.status, JobStatus.PENDING)
+
+        self.manager.cancel(cancelled_job.id)
+        self.assertEqual(cancelled_job.status, JobStatus.CANCELLED)
+
+        self.wait(first_job.id)
+        self.assertEqual(first_job.status, JobStatus.DONE)
+        assert first_job.result is not None
+        self.assertTrue(first_job.progress["finished"])
+        self.assertEqual(
+            first_job.progress["checked_configurations"],
+            first_job.progress["valid_configurations"]
+            + first_job.progress["error_configurations"],
+        )
+
+        self.wait(invalid_job.id)
+        self.assertEqual(invalid_job.status, JobStatus.INVALID)
+        assert invalid_job.error is not None
+        self.assertTrue(invalid_job.error.startswith("Invalid model"))
+
+        self.manager.remove(first_job.id)
+        self.assertIsNone(self.manager.get(first_job.id))
+
+
+class TestWarmWorkers(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = JobManager(
+            max_workers=2, evaluation_cache_dir=self.directory.name
+        )
+        self.model_text = yaml.dump(test_model_dict)
+
+    def tearDown(self) -> None:
+        self.manager.close()
+        self.directory.cleanup()
+
+    def test_model_routing(self):
+        """A repeated model goes to the worker that ran it, which reuses its results"""
+        first_job = self.manager.submit(self.model_text)
+        self.manager.wait(first_job.id, timeout=60)
+        self.assertEqual(first_job.status, JobStatus.DONE)
+        self.assertEqual(first_job.progress["evaluation_cache_hit_rate"], 0.0)
+
+        repeated_job = self.manager.submit(self.model_text)
+        self.manager.wait(repeated_job.id, timeout=60)
+        self.assertEqual(repeated_job.status, JobStatus.DONE)
+        self.assertEqual(repeated_job.progress["evaluation_cache_hit_rate"], 1.0)
+        self.assertEqual(repeated_job.result, first_job.result)
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        server.app.config.update(
+            MODEL_CACHE_DIR=os.path.join(self.directory.name, "models"),
+            EVALUATION_CACHE_DIR=os.path.join(self.directory.name, "evaluations"),
+            JOB_WORKERS=1,
+        )
+        self.client = server.app.test_client()
+        self.model_text = yaml.dump(test_model_dict)
+
+    def tearDown(self) -> None:
+        if server.job_manager is not None:
+            server.job_manager.close()
+            server.job_manager = None
+        self.directory.cleanup()
+
+    def test_job_routes(self):
+        """A submitted job is queried and streamed until it finishes, unknown jobs are not found"""
+        response = self.client.post("/jobs", data=self.model_text)
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.data)["id"]
+        self.assertEqual(response.headers["Location"], f"/jobs/{job_id}")
+
+        response = self.client.get(f"/jobs/{job_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["id"], job_id)
+
+        # The stream ends when the job finishes
+        response = self.client.get(f"/jobs/{job_id}/events")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = [
+            event.split("\n")
+            for event in response.get_data(as_text=True).split("\n\n")
+            if event.startswith("event:")
+        ]
+        self.assertEqual(events[-1][0], "event: done")
+        final_job = json.loads(events[-1][1].removeprefix("data: "))
+        self.assertEqual(final_job["status"], JobStatus.DONE.value)
+        self.assertEqual(json.loads(self.client.get(f"/jobs/{job_id}").data), final_job)
+
+        for response in (
+            self.client.get("/jobs/unknown"),
+            self.client.get("/jobs/unknown/events"),
+            self.client.delete("/jobs/unknown"),
+        ):
+            self.assertEqual(response.status_code, 404)
+
+    def test_delete_running_job(self):
+        """Deleting a running job cancels it and the worker takes the next job"""
+        response = self.client.post("/jobs", data=yaml.dump(long_model_dict()))
+        job_id = json.loads(response.data)["id"]
+
+        manager = server.get_job_manager()
+        deadline = time.monotonic() + 60
+        while not manager.get(job_id).progress:  # type: ignore
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+        response = self.client.delete(f"/jobs/{job_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["status"], JobStatus.CANCELLED.value)
+        self.assertEqual(self.client.get(f"/jobs/{job_id}").status_code, 404)
+
+        response = self.client.post("/run", data=self.model_text)
+        self.assertEqual(response.status_code, 200)
+
+    def test_run_invalid_model(self):
+        """A model that can't be parsed is a bad request"""
+        response = self.client.post("/run", data="Stations: [")
+
+        self.assertEqual(response.status_code, 400)
+        error = json.loads(response.data)["error"]
+        self.assertTrue(error.startswith("Invalid model"))
+        self.assertNotIn("Traceback", error)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import yaml
+
+from model_cache import load_compiled_model, model_key
+from model.test_plant_state import test_model_dict
+
+
+class TestModelCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.model_text = yaml.dump(test_model_dict)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_reload(self):
+        """A cached model is loaded with the same spec, process graph and reach tables"""
+        compiled_model = load_compiled_model(
+            self.model_text, self.directory.name, use_reach_tables=False
+        )
+        self.assertIsNone(compiled_model.reach_tables)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(
+                    self.directory.name, f"{model_key(self.model_text)}.pickle"
+                )
+            )
+        )
+
+        # Reach tables are added to the stored entry when they are needed
+        completed_model = load_compiled_model(self.model_text, self.directory.name)
+        assert completed_model.reach_tables is not None
+
+        cached_model = load_compiled_model(self.model_text, self.directory.name)
+        assert cached_model.reach_tables is not None
+
+        self.assertEqual(
+            cached_model.spec.content_hash(), compiled_model.spec.content_hash()
+        )
+        self.assertEqual(
+            cached_model.flow_graph.compiled.station_names,
+            compiled_model.flow_graph.compiled.station_names,
+        )
+        self.assertEqual(
+            cached_model.reach_tables.tables.keys(),
+            completed_model.reach_tables.tables.keys(),
+        )
+        for key, table in completed_model.reach_tables.tables.items():
+            np.testing.assert_array_equal(cached_model.reach_tables.tables[key], table)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+import unittest
+
+from graph import TreeNode
+from graph.process import ManufacturingProcessGraph
+from graph.test_problem import small_model_spec
+from model import Vector
+from model.symmetry import PlantSymmetry
+from parallel import parallel_search
+from support import SearchContext
+
+
+class TestParallelSearch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.spec = small_model_spec()
+        cls.flow_graph = ManufacturingProcessGraph(cls.spec.model)
+        cls.flow_graph.generate_model_graph()
+
+    def first_node(self) -> TreeNode:
+        return TreeNode("InOut", Vector(2, 0), None)
+
+    def search_results(self, context: SearchContext) -> tuple:
+        return (
+            context.count_of_total_configurations,
+            context.count_of_checked_configurations,
+            context.count_of_valid_configurations,
+            context.best_performance_ratio,
+            context.best_performance_state,
+        )
+
+    def test_same_result_as_sequential_search(self):
+        """The parallel search checks the same configurations and finds the same best one as the sequential search, with and without symmetry"""
+        symmetry = PlantSymmetry.detect(self.spec, Vector(2, 0), True)
+        self.assertIsNotNone(symmetry)
+
+        for search_symmetry in (None, symmetry):
+            sequential_context = SearchContext()
+            sequential_context.check_configurations(
+                sequential_context.iterate(
+                    self.first_node(),
+                    self.spec.model.stations.models,
+                    self.spec,
+                    symmetry=search_symmetry,
+                ),
+                self.flow_graph,
+                self.spec,
+            )
+            sequential_results = self.search_results(sequential_context)
+            self.assertGreater(sequential_context.count_of_valid_configurations, 0)
+
+            for split_depth in (1, 2):
+                with self.subTest(symmetry=search_symmetry, split_depth=split_depth):
+                    parallel_context = SearchContext()
+                    parallel_search(
+                        parallel_context,
+                        self.first_node(),
+                        self.spec,
+                        workers=2,
+                        split_depth=split_depth,
+                        symmetry=search_symmetry,
+                        flow_graph=self.flow_graph,
+                    )
+                    self.assertEqual(
+                        self.search_results(parallel_context), sequential_results
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,85 @@
+from itertools import islice
+import os
+import unittest
+
+import yaml
+
+from graph import TreeNode
+from graph.process import ManufacturingProcessGraph
+from model import Vector
+from model.test_plant_state import test_model_dict
+from model.tools import SystemSpecification
+from support import SearchContext
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "model.yaml")
+
+
+class TestSearchContext(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.spec = SystemSpecification(model_string=yaml.dump(test_model_dict))
+
+    def generate(self, context: SearchContext) -> list:
+        return list(
+            context.iterate(
+                TreeNode("InOut", Vector(2, 0), None),
+                self.spec.model.stations.models,
+                self.spec,
+            )
+        )
+
+    def test_independent_runs(self):
+        """Each run has its own repository and counters, a second run generates the same configurations"""
+        first_context = SearchContext()
+        configurations = self.generate(first_context)
+        self.assertGreater(len(configurations), 0)
+
+        second_context = SearchContext()
+        self.assertEqual(self.generate(second_context), configurations)
+        self.assertEqual(second_context.evaluated_nodes, first_context.evaluated_nodes)
+        self.assertEqual(second_context.valid_nodes, first_context.valid_nodes)
+        self.assertEqual(
+            second_context.repository_size(), first_context.repository_size()
+        )
+
+        # The same context has already seen every configuration
+        self.assertEqual(self.generate(first_context), [])
+
+    def test_visibility_graph_counters(self):
+        """Each run counts its own lookups in the shared visibility graph cache"""
+        with open(MODEL_PATH, encoding="utf8") as model_file:
+            spec = SystemSpecification(model_stream=model_file)
+        flow_graph = ManufacturingProcessGraph(spec.model)
+        flow_graph.generate_model_graph()
+        configurations = list(
+            islice(
+                SearchContext().iterate(
+                    TreeNode("InOut", Vector(2, 0), None),
+                    spec.model.stations.models,
+                    spec,
+                ),
+                20,
+            )
+        )
+
+        first_context = SearchContext()
+        first_context.check_configurations(configurations, flow_graph, spec)
+        lookups = (
+            first_context.visibility_graph_hits + first_context.visibility_graph_misses
+        )
+        self.assertGreater(lookups, 0)
+
+        # The graphs of the first run are in the cache, and its counters are not changed
+        second_context = SearchContext()
+        second_context.check_configurations(configurations, flow_graph, spec)
+        self.assertEqual(second_context.visibility_graph_hits, lookups)
+        self.assertEqual(second_context.visibility_graph_misses, 0)
+        self.assertEqual(second_context.visibility_graph_hit_rate(), 1.0)
+        self.assertEqual(
+            first_context.visibility_graph_hits + first_context.visibility_graph_misses,
+            lookups,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Vectors created by a full search of model.yaml without symmetry. Placed stations and cells share their immutable vectors, so about 4200 are created, against 13600 when each placement and copy created its own
+VECTOR_ALLOCATION_BUDGET = 6000
+
+VECTOR_BENCHMARK = """
+import json, sys
+import model
+from graph import TreeNode
+from graph.process import ManufacturingProcessGraph
+from model.tools import SystemSpecification
+from support import SearchContext
+
+allocations = 0
+vector_init = model.Vector.__init__
+
+def counting_init(self, x, y):
+    global allocations
+    allocations += 1
+    vector_init(self, x, y)
+
+with open(sys.argv[1], encoding="utf8") as model_file:
+    spec = SystemSpecification(model_stream=model_file)
+flow_graph = ManufacturingProcessGraph(spec.model)
+flow_graph.generate_model_graph()
+
+class DictVector:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+dict_vector = DictVector(1.0, 2.0)
+
+model.Vector.__init__ = counting_init
+context = SearchContext()
+context.check_configurations(
+    context.iterate(
+        TreeNode("InOut", model.Vector(2, 0), None), spec.model.stations.models, spec
+    ),
+    flow_graph,
+    spec,
+)
+
+print(json.dumps({
+    "allocations": allocations,
+    "vector_bytes": sys.getsizeof(model.Vector(1.0, 2.0)),
+    "dict_vector_bytes": sys.getsizeof(dict_vector) + sys.getsizeof(dict_vector.__dict__),
+}))
+"""
+
+
+class TestVectorBenchmark(unittest.TestCase):
+
+    def test_search_allocations(self):
+        """A search creates few vectors, and each one is smaller than an instance with a __dict__"""
+        source_directory = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                VECTOR_BENCHMARK,
+                os.path.join(source_directory, "..", "model.yaml"),
+            ],
+            cwd=source_directory,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        benchmark = json.loads(output.splitlines()[-1])
+
+        self.assertLess(benchmark["allocations"], VECTOR_ALLOCATION_BUDGET)
+        self.assertLess(benchmark["vector_bytes"], benchmark["dict_vector_bytes"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
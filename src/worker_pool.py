@@ -0,0 +1,132 @@
+"""Worker pools
+
+The parallel search and the batch evaluation run in pools of worker processes that keep their state between tasks. The state of each worker is created once per process by the initializer of the pool, so the specification, the process graph and the checkers are sent once to each worker instead of with every task.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Sequence
+
+from evaluation_cache import EvaluationCache
+from graph.problem import (
+    FeasibilityChecker,
+    PathingLowerBound,
+    ReachTables,
+    check_configuration_v2,
+)
+from graph.process import ManufacturingProcessGraph
+from model.plant_graph import GraphPlant
+from model.plant_state import PlantState
+from model.symmetry import PlantSymmetry
+from model.tools import SystemSpecification
+from support import SearchContext
+
+
+class WorkerState:
+    """Specification, process graph and checkers of a worker, with a plant reused for every configuration it evaluates
+
+    With a single worker, the state is created in the current process. The evaluation doesn't modify the graph nor the checkers, so the instances of the main process are used as they are.
+    """
+
+    def __init__(
+        self,
+        spec: SystemSpecification,
+        flow_graph: ManufacturingProcessGraph,
+        reach_tables: ReachTables | None = None,
+        symmetry: PlantSymmetry | None = None,
+        lower_bound: PathingLowerBound | None = None,
+        feasibility: FeasibilityChecker | None = None,
+        cache_path: str | None = None,
+    ) -> None:
+        self.spec = spec
+        self.flow_graph = flow_graph
+        self.reach_tables = reach_tables
+        self.symmetry = symmetry
+        self.lower_bound = lower_bound
+        self.feasibility = feasibility
+        # Eviction is left to the main process
+        self.cache = (
+            EvaluationCache(cache_path, spec, symmetry)
+            if cache_path is not None
+            else None
+        )
+
+        self._plant = GraphPlant(spec)
+
+    def evaluate(self, states: Sequence[PlantState]) -> list[float | bool]:
+        """Evaluate complete configurations, the results are the same as check_configuration_v2"""
+        results: list[float | bool] = []
+
+        for state in states:
+            self._plant.import_state(state)
+            self._plant.set_ready()
+            results.append(
+                check_configuration_v2(self._plant, self.flow_graph, self.reach_tables)
+            )
+
+        return results
+
+    def search(self, root: PlantState, excluded: Sequence[PlantState]) -> SearchContext:
+        """Generate and check the configurations that extend root in a new context, see SearchContext.iterate_plant
+
+        The cache hits and misses are reset, so they only count this search.
+        """
+        context = SearchContext()
+        if self.cache is not None:
+            self.cache.hits = 0
+            self.cache.misses = 0
+
+        plant = GraphPlant(self.spec)
+        plant.import_state(root)
+
+        station_models_used = {
+            name
+            for name, location in plant.stations().items()
+            if isinstance(location, int) or location.x != -1
+        }
+
+        context.check_configurations(
+            context.iterate_plant(
+                plant,
+                station_models_used,
+                self.spec.model.stations.models,
+                excluded=excluded,
+                symmetry=self.symmetry,
+                lower_bound=self.lower_bound,
+                feasibility=self.feasibility,
+            ),
+            self.flow_graph,
+            self.spec,
+            self.cache,
+            self.reach_tables,
+        )
+
+        if self.cache is not None:
+            self.cache.flush()
+
+        return context
+
+
+def create_pool(workers: int, *state_args: Any) -> ProcessPoolExecutor:
+    """Create a pool of processes, each one with a WorkerState created from state_args, see worker_state"""
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=state_args
+    )
+
+
+# Worker process state, created once per process of the pool by _init_worker
+_worker_state: WorkerState | None = None
+
+
+def _init_worker(*state_args: Any) -> None:
+    global _worker_state  # pylint: disable=global-statement
+
+    _worker_state = WorkerState(*state_args)
+
+
+def worker_state() -> WorkerState:
+    """Get the state of the current worker process, for the tasks submitted to a pool created by create_pool"""
+    assert _worker_state is not None
+
+    return _worker_state